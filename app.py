@@ -1,75 +1,106 @@
-from flask import Flask, render_template, request, session, redirect, url_for
-from flask_session import Session
+import time
+STARTED = time.perf_counter()  # Start of the startup timing breakdown
+
+from flask import Flask, render_template, request, session, redirect, url_for, g
 import os
-import json
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import base64
+import logging
+from routes.logs import configure_logging
+from routes import sheets_client
+from routes.startup import StartupTimer
+from routes.sessions import configure_sessions
+from routes.compression import compress_response
+from routes.timing import start_request_timer, add_server_timing
+from routes.metrics import start_request_metrics, record_request_metrics
+
+# LOG_LEVEL / LOG_FORMAT (text or json); see routes/logs.py
+configure_logging()
+logger = logging.getLogger(__name__)
+
+startup_timer = StartupTimer(STARTED)
+startup_timer.phase("flask")
 
 # Initialize app
 app = Flask(__name__)
-app.secret_key = "secret_key"
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+app.secret_key = os.getenv("SECRET_KEY", "secret_key")
+# In-memory sessions by default; see SESSION_BACKEND in routes/sessions.py
+configure_sessions(app)
 
 # Password to protect the app
 APP_PASSWORD = "abc123"
 
-# Create reports folder if not exists
+# Reports folder (created by the report store when the first report is written)
 REPORT_FOLDER = "reports"
-os.makedirs(REPORT_FOLDER, exist_ok=True)
 
-# Load Google credentials from environment variable (Base64 encoded)
+# Google credentials (Base64 encoded) are decoded when the sheet is first read
 google_credentials_b64 = os.getenv("GOOGLE_CREDENTIALS", None)
 python_version = os.getenv("PYTHON_VERSION", None)
 
-# Decode credentials
 if google_credentials_b64:
-    try:
-        google_credentials_json = json.loads(base64.b64decode(google_credentials_b64).decode("utf-8"))
-        print("Google credentials loaded successfully.")
-    except Exception as e:
-        print(f"Error decoding Google credentials: {e}")
+    logger.info("Google credentials found in environment variable GOOGLE_CREDENTIALS.")
 else:
-    print("Google credentials not found in environment variable GOOGLE_CREDENTIALS.")
+    logger.warning("Google credentials not found in environment variable GOOGLE_CREDENTIALS.")
 
 if python_version:
-    print(f"Python Version: {python_version}")
+    logger.info(f"Python Version: {python_version}")
 else:
-    print("Python version is not set.")
+    logger.info("Python version is not set.")
 
-# Authenticate Google Sheets
+# Authenticate Google Sheets (shared, already-authorized client)
 def authenticate_google_sheets():
-    if google_credentials_b64:
-        try:
-            credentials = ServiceAccountCredentials.from_json_keyfile_dict(
-                google_credentials_json,
-                scope=["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            )
-            client = gspread.authorize(credentials)
-            return client
-        except Exception as e:
-            print(f"Error authenticating with Google Sheets: {e}")
-            raise
-    else:
-        raise Exception("Google credentials are missing. Please set the GOOGLE_CREDENTIALS environment variable.")
+    try:
+        return sheets_client.get_client()
+    except Exception as e:
+        logger.error(f"Error authenticating with Google Sheets: {e}")
+        raise
 
 # ----------------------------------------
 # PASSWORD PROTECTION
 # ----------------------------------------
 
+# Request timer first, so Server-Timing's total covers every other hook
+app.before_request(start_request_timer)
+# Per-endpoint request counts and latency for /metrics (redirects to login included)
+app.before_request(start_request_metrics)
+
 @app.before_request
 def require_login():
-    allowed_routes = ["login", "static", "favicon"]
+    # /metrics is scraped without a session
+    allowed_routes = ["login", "static", "favicon", "metrics.metrics"]
     if "logged_in" not in session and request.endpoint not in allowed_routes:
         return redirect(url_for("login"))
 
+@app.after_request
+def add_data_age_header(response):
+    # Age (seconds) of the cached sheet data used to build this response
+    data_age = g.get("data_age")
+    if data_age is not None:
+        response.headers["X-Data-Age"] = f"{data_age:.0f}"
+    # Version the request read; pass it back as ?v= to read the same data again
+    data_version = g.get("data_version")
+    if data_version is not None:
+        response.headers["X-Data-Version"] = data_version
+    return response
+
+# gzip / brotli for large HTML and JSON responses
+app.after_request(compress_response)
+
+# Server-Timing header with the per-stage timings (SERVER_TIMING=0 disables)
+app.after_request(add_server_timing)
+app.after_request(record_request_metrics)
+
+# Startup timing breakdown, also served under /cache/status
+app.extensions["startup_timer"] = startup_timer
+app.after_request(startup_timer.response_sent)
+startup_timer.phase("app setup")
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         password = request.form.get("password")
         if password == APP_PASSWORD:
             session["logged_in"] = True
+            # Stay logged in for PERMANENT_SESSION_LIFETIME (31 days), as before
+            session.permanent = True
             return redirect(url_for("home"))
         else:
             return render_template("login.html", error="Invalid password.")
@@ -92,7 +123,7 @@ def fetch_data():
         data = sheet.get_all_records()
         return render_template("data_display.html", data=data)
     except Exception as e:
-        print(f"Error fetching data: {e}")  # Log the error
+        logger.error(f"Error fetching data: {e}")
         return f"Error fetching data: {e}"
 
 # ----------------------------------------
@@ -108,6 +139,10 @@ from routes.age_analysis import age_analysis_bp
 from routes.chart_make import chart_make_bp
 from routes.chart_type import chart_type_bp
 from routes.chart_age import chart_age_bp
+from routes.cache_route import cache_bp
+from routes.report_route import reports_bp
+from routes.dashboard import dashboard_bp
+from routes.metrics_route import metrics_bp
 
 app.register_blueprint(index_bp, url_prefix="/filter")
 app.register_blueprint(download_bp)
@@ -117,6 +152,27 @@ app.register_blueprint(age_analysis_bp)
 app.register_blueprint(chart_make_bp)
 app.register_blueprint(chart_type_bp)
 app.register_blueprint(chart_age_bp)
+app.register_blueprint(cache_bp)
+app.register_blueprint(reports_bp)
+app.register_blueprint(dashboard_bp)
+app.register_blueprint(metrics_bp)
+startup_timer.phase("blueprints")
+
+# Start from the local snapshot (if any) instead of an empty cache; with
+# DATA_SNAPSHOT_HYDRATE=lazy (the default) the first request needing data loads it
+from routes.utils import hydrate_from_snapshot, dataset_cache, SNAPSHOT_HYDRATE
+hydrated = SNAPSHOT_HYDRATE == "startup" and hydrate_from_snapshot()
+startup_timer.phase("snapshot")
+
+# Optional: precompute every selector's charts and reports after each refresh
+from routes.prewarm import prewarmer, PREWARM_ENABLED
+if PREWARM_ENABLED:
+    prewarmer.init_app(app)
+    if hydrated:
+        df, error, _ = dataset_cache.get()
+        if not error:
+            prewarmer.start(df, dataset_cache.version)
+startup_timer.phase("prewarm")
 
 # ----------------------------------------
 # Home page
@@ -140,6 +196,8 @@ def home_redirect():
     session["end_date"] = end_date
     return redirect(next_page)
 
+startup_timer.finish()
+
 # ----------------------------------------
 # Run
 # ----------------------------------------
@@ -0,0 +1,92 @@
+"""Synthetic damper test logs shaped like the Google Sheet.
+
+    python benchmarks/generate_data.py --rows 1000000 --out benchmarks/data/dampers_1m.parquet
+
+Columns: Sl No, Make, TYPE OF DAMPER, Age ("N days", with some bare numbers
+and blanks), Test Result (PASS / FAIL) and Test date time. A small share of
+labels is misspelt the way the sheet's are (case, spacing, the known
+"VERTICALDAMPER" variant) so the normalization runs as it does on real data.
+Failure rates rise with age and differ per make. Written as .parquet or
+.csv depending on the extension.
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+MAKES = ["KONI", "SACHS", "KNORR", "GABRIEL", "ESCORTS", "IAI", "G.B. EQPTS"]
+MAKE_WEIGHTS = [0.26, 0.22, 0.16, 0.12, 0.10, 0.09, 0.05]
+MAKE_FAIL_RATE = [0.12, 0.15, 0.10, 0.22, 0.25, 0.28, 0.30]
+TYPES = [
+    "LHB NAC SEC VERTICAL DAMPER",
+    "ICF BOGIE DAMPER",
+    "VB YAW DAMPER",
+    "LHB PRIMARY VERTICAL DAMPER",
+    "LHB SEC LATERAL DAMPER",
+]
+TYPE_WEIGHTS = [0.30, 0.28, 0.17, 0.15, 0.10]
+# Spelling variants found in the sheet, used for a share of the rows
+TYPE_VARIANTS = {"LHB NAC SEC VERTICAL DAMPER": "LHB NAC SEC VERTICALDAMPER"}
+DIRTY_SHARE = 0.02
+FIRST_TEST_DAY = "2022-04-01"
+TEST_DAYS = 3 * 365
+
+
+def generate(rows, seed=1):
+    rng = np.random.default_rng(seed)
+
+    make_ids = rng.choice(len(MAKES), size=rows, p=MAKE_WEIGHTS)
+    makes = np.array(MAKES, dtype=object)[make_ids]
+    dirty = rng.random(rows) < DIRTY_SHARE
+    makes[dirty] = np.char.add(" ", np.char.lower(makes[dirty].astype(str)))
+
+    types = np.array(TYPES, dtype=object)[rng.choice(len(TYPES), size=rows, p=TYPE_WEIGHTS)]
+    for label, variant in TYPE_VARIANTS.items():
+        types[(types == label) & (rng.random(rows) < DIRTY_SHARE)] = variant
+
+    # Most dampers come back within five years; a tail runs much longer
+    age_days = np.minimum(rng.gamma(2.0, 600.0, size=rows), 6000).astype(np.int64) + 30
+    ages = np.char.add(age_days.astype(str), " days").astype(object)
+    form = rng.random(rows)
+    ages[form < 0.05] = age_days[form < 0.05]
+    ages[(form >= 0.05) & (form < 0.07)] = ""
+
+    fail_rate = np.array(MAKE_FAIL_RATE)[make_ids] * (0.6 + age_days / 2500)
+    results = np.where(rng.random(rows) < np.minimum(fail_rate, 0.9), "FAIL", "PASS")
+
+    seconds = rng.integers(0, TEST_DAYS * 86400, size=rows)
+    tested = np.datetime64(FIRST_TEST_DAY, "s") + seconds
+    tested = np.char.replace(np.datetime_as_string(tested, unit="s"), "T", " ").astype(object)
+    tested[rng.random(rows) < 0.01] = ""
+
+    return pd.DataFrame({
+        "Sl No": np.arange(1, rows + 1),
+        "Make": makes,
+        "TYPE OF DAMPER": types,
+        "Age": ages,
+        "Test Result": results,
+        "Test date time": tested,
+    })
+
+
+def write(df, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".parquet"):
+        # Mixed "N days" / number / blank ages are stored as text, as in the sheet
+        df.astype({"Age": str}).to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", required=True, help=".parquet or .csv file to write")
+    args = parser.parse_args()
+    write(generate(args.rows, args.seed), args.out)
+    print(f"Wrote {args.rows} rows to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
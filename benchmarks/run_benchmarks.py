@@ -0,0 +1,225 @@
+"""End-to-end endpoint benchmarks against generated damper data.
+
+    python benchmarks/run_benchmarks.py --rows 1000 100000 1000000 --repeat 20
+
+For each size a dataset is generated (see generate_data.py; files are
+reused from --data-dir) and served to the app through DAMPER_DATA_FILE, so
+no Google Sheet is needed. Every size runs in a fresh process. Each
+endpoint is called once (first_ms, which includes loading the data for the
+first one) and then --repeat times for p50 / p95 / mean latency. Peak RSS
+is recorded after every endpoint and for the whole run; --tracemalloc also
+records the peak Python/numpy allocation of one extra call per endpoint.
+
+The result memo is disabled (RESULT_MEMO_SIZE=0) so repeats measure the
+actual work; pass --memo to benchmark with it. Results are written as JSON
+(--out) to compare runs across changes.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PERIOD = ("2023-01-01", "2024-12-31")
+MAKE = "KONI"
+DAMPER_TYPE = "ICF BOGIE DAMPER"
+AGE_GROUP = "3-5 years"
+
+# (name, method, path, form data); "{type_report}" / "{age_report}" are the
+# download links of the reports queued by the analysis endpoints
+ENDPOINTS = [
+    ("filter_page", "GET", "/filter/", None),
+    ("filter_submit", "POST", "/filter/", {"make": MAKE, "age_group": "ALL", "damper_type": "ALL"}),
+    ("analyze_make", "GET", f"/analyze_make?value={MAKE}", None),
+    ("analyze_make_all", "GET", "/analyze_make?value=ALL", None),
+    ("analyze_type", "GET", f"/analyze_type?value={DAMPER_TYPE}", None),
+    ("analyze_age", "GET", f"/analyze_age?value={AGE_GROUP}", None),
+    ("chart_make", "GET", f"/chart_make_analysis?make={MAKE}", None),
+    ("chart_type", "GET", "/chart_type_analysis?type=All", None),
+    ("chart_age", "GET", "/age_group_analysis?group=ALL", None),
+    ("dashboard_charts", "GET", "/dashboard_charts?makes=KONI,SACHS,KNORR,GABRIEL,ESCORTS,IAI,G.B. EQPTS", None),
+    ("dropdown_makes", "GET", "/get_all_makes", None),
+    ("download_report", "GET", "/download", None),
+    ("download_report_csv", "GET", "/download?format=csv", None),
+    ("download_raw_csv", "GET", "/download?rows=raw&format=csv", None),
+    ("download_raw_parquet", "GET", "/download?rows=raw&format=parquet", None),
+    ("download_filter_report", "GET", "/filter/download", None),
+    ("download_make_report", "GET", "/download_make_analysis", None),
+    ("download_type_report", "GET", "{type_report}", None),
+    ("download_age_report", "GET", "{age_report}", None),
+]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+
+    def percentile(q):
+        # Nearest-rank percentile
+        index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+        return round(ordered[index], 2)
+
+    return {
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "mean_ms": round(sum(ordered) / len(ordered), 2),
+        "min_ms": round(ordered[0], 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def run_child(args):
+    # Runs inside the benchmark process for one dataset (environment already set)
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    started = time.perf_counter()
+    from app import app
+    from routes.utils import report_jobs
+    import_s = time.perf_counter() - started
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+        session["start_date"], session["end_date"] = PERIOD
+
+    def call(method, path, data):
+        t = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        body = response.get_data()
+        return (time.perf_counter() - t) * 1000, response, body
+
+    links = {}
+    endpoints = {}
+    for name, method, path, data in ENDPOINTS:
+        if path.startswith("{"):
+            path = links.get(path.strip("{}"))
+            if path is None:
+                endpoints[name] = {"error": "report link not available"}
+                continue
+        if name.startswith("download"):
+            report_jobs.wait()  # Report downloads need the background job done
+
+        first_ms, response, body = call(method, path, data)
+        result = {"path": path, "status": response.status_code, "bytes": len(body), "first_ms": round(first_ms, 2)}
+        if response.is_json and name in ("analyze_type", "analyze_age"):
+            job = response.get_json().get("report_job") or {}
+            report_jobs.wait()
+            status = client.get(job["status_url"]).get_json() if job.get("status_url") else {}
+            links[name.replace("analyze_", "") + "_report"] = status.get("download_link")
+
+        result.update(summarize([call(method, path, data)[0] for _ in range(args.repeat)]))
+        if args.tracemalloc:
+            tracemalloc.start()
+            call(method, path, data)
+            result["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            tracemalloc.stop()
+        result["peak_rss_mb"] = peak_rss_mb()
+        endpoints[name] = result
+        print(f"  {name:24s} {result['status']}  first {result['first_ms']:9.1f}ms"
+              f"  p50 {result['p50_ms']:9.1f}ms  p95 {result['p95_ms']:9.1f}ms", file=sys.stderr)
+
+    with open(args.child_out, "w") as f:
+        json.dump({"import_s": round(import_s, 3), "peak_rss_mb": peak_rss_mb(), "endpoints": endpoints}, f)
+
+
+def dataset_path(data_dir, rows, seed, fmt):
+    return os.path.join(data_dir, f"dampers_{rows}_seed{seed}.{fmt}")
+
+
+def run_size(args, rows):
+    sys.path.insert(0, HERE)
+    from generate_data import generate, write
+
+    path = dataset_path(args.data_dir, rows, args.seed, args.format)
+    generate_s = None
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        write(generate(rows, args.seed), path)
+        generate_s = round(time.perf_counter() - started, 3)
+
+    env = dict(
+        os.environ,
+        DAMPER_DATA_FILE=path,
+        DATA_SNAPSHOT_ENABLED="0",
+        PREWARM_ENABLED="0",
+        SESSION_BACKEND="memory",
+        # The app logs to stderr; keep only its warnings unless --verbose
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "INFO" if args.verbose else "WARNING"),
+    )
+    if not args.memo:
+        env["RESULT_MEMO_SIZE"] = "0"
+
+    fd, child_out = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--child-out", child_out,
+               "--repeat", str(args.repeat)] + (["--tracemalloc"] if args.tracemalloc else [])
+    print(f"{rows} rows ({path})", file=sys.stderr)
+    try:
+        subprocess.run(command, env=env, cwd=ROOT, check=True,
+                       stdout=None if args.verbose else subprocess.DEVNULL)
+        with open(child_out) as f:
+            result = json.load(f)
+    finally:
+        os.remove(child_out)
+    return {"rows": rows, "data_file": path, "generate_s": generate_s, **result}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    parser.add_argument("--data-dir", default=os.path.join(HERE, "data"))
+    parser.add_argument("--out", default=os.path.join(HERE, "results.json"))
+    parser.add_argument("--memo", action="store_true", help="keep the result memo enabled")
+    parser.add_argument("--tracemalloc", action="store_true", help="also record allocation peaks")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--child-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "memo": args.memo,
+        "period": PERIOD,
+        "runs": [run_size(args, rows) for rows in args.rows],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+from flask import Blueprint, current_app, jsonify
+from .utils import dataset_cache, get_failure_cube, result_memo, report_jobs, dimension_index
+from .report_store import all_stores
+from .compression import compressed_bodies
+from .prewarm import prewarmer
+from .sessions import session_stats
+
+cache_bp = Blueprint("cache", __name__)
+
+@cache_bp.route("/cache/status")
+def cache_status():
+    stats = dataset_cache.stats()
+    cube, error = get_failure_cube() if stats["loaded"] else (None, None)
+    if cube is not None:
+        # Rows whose test date could not be parsed (excluded from every period)
+        stats["undated_rows"] = int(cube.undated()["Receipts"].sum())
+    stats["dimension_index"] = dimension_index.stats()
+    stats["memo"] = result_memo.stats()
+    stats["report_stores"] = [store.stats() for store in all_stores()]
+    stats["report_jobs"] = report_jobs.stats()
+    stats["compression_cache"] = compressed_bodies.stats()
+    stats["prewarm"] = prewarmer.stats()
+    stats["sessions"] = session_stats(current_app)
+    startup_timer = current_app.extensions.get("startup_timer")
+    if startup_timer is not None:
+        stats["startup"] = startup_timer.report()
+    return jsonify(stats)
+
+@cache_bp.route("/cache/invalidate", methods=["POST"])
+def cache_invalidate():
+    dataset_cache.invalidate()
+    result_memo.clear()
+    return jsonify({"status": "invalidated", **dataset_cache.stats()})
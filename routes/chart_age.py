@@ -1,112 +1,80 @@
 from flask import Blueprint, jsonify, render_template, request, session
-import pandas as pd
-import numpy as np
-from .utils import get_google_sheets_data
+from .utils import dimension_values, get_failure_cube, memoized, conditional
+from .chart_counts import ChartCounts, descending, percent, round2
+from .timing import stage
 
 chart_age_bp = Blueprint("chart_age_bp", __name__)
 
-@chart_age_bp.route("/chart_age")
-def chart_age():
-    return render_template("chart_age.html")
-
-@chart_age_bp.route("/age_group_analysis")
-def age_group_analysis():
-    age_group = request.args.get("group", "").strip()
-    start_date = session.get('start_date', None)
-    end_date = session.get('end_date', None)
-
-    df, error = get_google_sheets_data()
-    if error:
-        return jsonify({"error": str(error)}), 500
-
-    if "Age Group" not in df.columns:
-        df["Age"] = df["Age"].astype(str).str.replace(" days", "", regex=True).str.strip()
-        df["Age"] = pd.to_numeric(df["Age"], errors="coerce")
-
-        def categorize_age(days):
-            if pd.isna(days):
-                return "3-5 years"
-            days = int(days)
-            if days < 730:
-                return "Less than 2 years"
-            elif 730 <= days < 1095:
-                return "2-3 years"
-            elif 1095 <= days < 1825:
-                return "3-5 years"
-            else:
-                return "Above 5 years"
-
-        df["Age Group"] = df["Age"].apply(categorize_age)
-
-    # Filter by date
-    if start_date and end_date:
-        df["Test date time"] = pd.to_datetime(df["Test date time"], errors="coerce")
-        df = df[(df["Test date time"] >= pd.to_datetime(start_date)) & (df["Test date time"] <= pd.to_datetime(end_date))]
-
-    if age_group.upper() == "ALL":
-        df_filtered = df[(df["TYPE OF DAMPER"].notna()) & (df["Make"].notna())].copy()
+def _share_table(totals, column):
+    # Per-label records with failure % and share of all failures, then a TOTAL row
+    total_failures = sum(failures for _, failures, _ in totals)
+    total_receipts = sum(receipts for _, _, receipts in totals)
+    records = [{
+        column: label,
+        "Failures": failures,
+        "Total_Receipts": receipts,
+        "Failure %": percent(failures, receipts),
+        "Failure Contribution %": percent(failures, total_failures),
+    } for label, failures, receipts in totals]
+    total = {
+        column: "TOTAL",
+        "Failures": total_failures,
+        "Total_Receipts": total_receipts,
+        "Failure %": percent(total_failures, total_receipts),
+        "Failure Contribution %": 100.0,
+    }
+    return records, total
+
+
+def _pareto_table(records, total):
+    # Records by failure contribution (descending) with the running share
+    pareto = descending(records, key=lambda record: record["Failure Contribution %"])
+    running = 0.0
+    rows = []
+    for record in pareto:
+        running += record["Failure Contribution %"]
+        cumulative = round2(running)
+        rows.append({**record, "Cumulative": cumulative,
+                     "Cumulative Failure %": cumulative, "Normalized Cumulative %": cumulative})
+    rows.append({**total, "Cumulative": 100.0, "Cumulative Failure %": 100.0, "Normalized Cumulative %": 100.0})
+    return rows
+
+
+def age_group_chart_payload(chart_counts, age_group):
+    # Chart data for one age group (or "ALL") from a ChartCounts; returns (payload, status)
+    if age_group.upper() != "ALL":
+        rows = chart_counts.rows_for("Age Group", age_group)
     else:
-        df_filtered = df[(df["Age Group"].str.strip() == age_group) & 
-                         (df["TYPE OF DAMPER"].notna()) & 
-                         (df["Make"].notna())].copy()
-
-    if df_filtered.empty:
-        return jsonify({"error": f"No data found for Age Group: {age_group}"}), 404
-
-    df_filtered["Failed"] = (df_filtered["Test Result"] == "FAIL").astype(int)
-    df_filtered["Total"] = 1
-
-    summary = df_filtered.groupby(["TYPE OF DAMPER", "Make"]).agg(
-        Failures=('Failed', 'sum'),
-        Total_Receipts=('Total', 'sum')
-    ).reset_index()
-    summary["Failure %"] = (summary["Failures"] / summary["Total_Receipts"] * 100).round(2)
-
-    type_summary = df_filtered.groupby("TYPE OF DAMPER").agg(
-        Failures=('Failed', 'sum'),
-        Total_Receipts=('Total', 'sum')
-    ).reset_index()
-    type_summary["Failure %"] = (type_summary["Failures"] / type_summary["Total_Receipts"] * 100).round(2)
-    type_summary["Failure Contribution %"] = (type_summary["Failures"] / type_summary["Failures"].sum() * 100).round(2)
-
-    make_summary = df_filtered.groupby("Make").agg(
-        Failures=('Failed', 'sum'),
-        Total_Receipts=('Total', 'sum')
-    ).reset_index()
-    make_summary["Failure %"] = (make_summary["Failures"] / make_summary["Total_Receipts"] * 100).round(2)
-    make_summary["Failure Contribution %"] = (make_summary["Failures"] / make_summary["Failures"].sum() * 100).round(2)
-
-    # Add totals row to each summary table
-    type_summary_with_total = type_summary.copy()
-    type_summary_with_total.loc[len(type_summary_with_total)] = [
-        "TOTAL", 
-        type_summary["Failures"].sum(), 
-        type_summary["Total_Receipts"].sum(),
-        (type_summary["Failures"].sum() / type_summary["Total_Receipts"].sum() * 100).round(2),
-        100.0
-    ]
-
-    make_summary_with_total = make_summary.copy()
-    make_summary_with_total.loc[len(make_summary_with_total)] = [
-        "TOTAL", 
-        make_summary["Failures"].sum(), 
-        make_summary["Total_Receipts"].sum(),
-        (make_summary["Failures"].sum() / make_summary["Total_Receipts"].sum() * 100).round(2),
-        100.0
-    ]
-    
-    matrix_with_total = summary.copy()
-    matrix_total = {
+        rows = chart_counts.rows
+
+    if not rows:
+        return {"error": f"No data found for Age Group: {age_group}"}, 404
+
+    matrix = chart_counts.totals(rows, ["TYPE OF DAMPER", "Make"])
+    matrix_percent = {key: percent(failures, receipts) for key, failures, receipts in matrix}
+
+    type_summary, type_total = _share_table(chart_counts.totals(rows, "TYPE OF DAMPER"), "TYPE OF DAMPER")
+    make_summary, make_total = _share_table(chart_counts.totals(rows, "Make"), "Make")
+
+    matrix_failures = sum(failures for _, failures, _ in matrix)
+    matrix_receipts = sum(receipts for _, _, receipts in matrix)
+    matrix_with_total = [{
+        "TYPE OF DAMPER": damper_type,
+        "Make": make,
+        "Failures": failures,
+        "Total_Receipts": receipts,
+        "Failure %": matrix_percent[(damper_type, make)],
+    } for (damper_type, make), failures, receipts in matrix]
+    matrix_with_total.append({
         "TYPE OF DAMPER": "TOTAL",
         "Make": "TOTAL",
-        "Failures": summary["Failures"].sum(),
-        "Total_Receipts": summary["Total_Receipts"].sum(),
-        "Failure %": (summary["Failures"].sum() / summary["Total_Receipts"].sum() * 100).round(2)
-    }
-    matrix_with_total = pd.concat([matrix_with_total, pd.DataFrame([matrix_total])], ignore_index=True)
+        "Failures": matrix_failures,
+        "Total_Receipts": matrix_receipts,
+        "Failure %": percent(matrix_failures, matrix_receipts),
+    })
 
-    unique_types = sorted(summary["TYPE OF DAMPER"].unique())
-    unique_makes = sorted(summary["Make"].unique())
+    unique_types = sorted({damper_type for damper_type, _ in matrix_percent})
+    unique_makes = sorted({make for _, make in matrix_percent})
 
     colors = [
         'rgba(255, 99, 132, 0.7)', 'rgba(54, 162, 235, 0.7)', 
@@ -117,117 +85,70 @@ def age_group_analysis():
 
     make_datasets = []
     for i, make in enumerate(unique_makes):
-        make_data = summary[summary["Make"] == make]
         dataset = {
             "label": make,
             "backgroundColor": colors[i % len(colors)],
-            "data": []
+            "data": [matrix_percent.get((damper_type, make), 0) for damper_type in unique_types]
         }
-        for damper_type in unique_types:
-            row = make_data[make_data["TYPE OF DAMPER"] == damper_type]
-            dataset["data"].append(row["Failure %"].values[0] if not row.empty else 0)
         make_datasets.append(dataset)
 
     # Pie charts
     pie_data = {
-        "labels": type_summary["TYPE OF DAMPER"].tolist(),
-        "values": type_summary["Failure Contribution %"].tolist(),
+        "labels": [record["TYPE OF DAMPER"] for record in type_summary],
+        "values": [record["Failure Contribution %"] for record in type_summary],
         "backgroundColor": [colors[i % len(colors)] for i in range(len(type_summary))],
     }
     pie_make_data = {
-        "labels": make_summary["Make"].tolist(),
-        "values": make_summary["Failure Contribution %"].tolist(),
+        "labels": [record["Make"] for record in make_summary],
+        "values": [record["Failure Contribution %"] for record in make_summary],
         "backgroundColor": [colors[i % len(colors)] for i in range(len(make_summary))],
     }
 
-    # PARETO CHART FIXES: Sort original data and prepare for total rows
-    # --------------- TYPE PARETO CHART ---------------
-    # First sort by Failure Contribution % (descending)
-    pareto_type = type_summary.sort_values("Failure Contribution %", ascending=False).copy()
-    pareto_type["Cumulative"] = pareto_type["Failure Contribution %"].cumsum().round(2)
-    
-    pareto_type_renamed = pareto_type.copy()
-    pareto_type_renamed["Cumulative Failure %"] = pareto_type_renamed["Cumulative"].copy()
-    pareto_type_renamed["Normalized Cumulative %"] = pareto_type_renamed["Cumulative"].copy()
-    
-    # Prepare total row for the end of the dataframe
-    total_row_pareto_type = pd.DataFrame([{
-        "TYPE OF DAMPER": "TOTAL",
-        "Failures": pareto_type_renamed["Failures"].sum(),
-        "Total_Receipts": pareto_type_renamed["Total_Receipts"].sum(),
-        "Failure %": (pareto_type_renamed["Failures"].sum() / pareto_type_renamed["Total_Receipts"].sum() * 100).round(2),
-        "Failure Contribution %": 100.0,
-        "Cumulative": 100.0,
-        "Cumulative Failure %": 100.0,
-        "Normalized Cumulative %": 100.0
-    }])
-    
-    # Simply append total row - no sorting needed after this
-    pareto_type_with_total = pd.concat([pareto_type_renamed, total_row_pareto_type], ignore_index=True)
-    
-    # --------------- MAKE PARETO CHART ---------------
-    # First sort by Failure Contribution % (descending)
-    pareto_make = make_summary.sort_values("Failure Contribution %", ascending=False).copy()
-    pareto_make["Cumulative"] = pareto_make["Failure Contribution %"].cumsum().round(2)
-    
-    pareto_make_renamed = pareto_make.copy()
-    pareto_make_renamed["Cumulative Failure %"] = pareto_make_renamed["Cumulative"].copy()
-    pareto_make_renamed["Normalized Cumulative %"] = pareto_make_renamed["Cumulative"].copy()
-    
-    # Prepare total row for the end of the dataframe
-    total_row_pareto_make = pd.DataFrame([{
-        "Make": "TOTAL",
-        "Failures": pareto_make_renamed["Failures"].sum(),
-        "Total_Receipts": pareto_make_renamed["Total_Receipts"].sum(),
-        "Failure %": (pareto_make_renamed["Failures"].sum() / pareto_make_renamed["Total_Receipts"].sum() * 100).round(2),
-        "Failure Contribution %": 100.0,
-        "Cumulative": 100.0,
-        "Cumulative Failure %": 100.0,
-        "Normalized Cumulative %": 100.0
-    }])
-    
-    # Simply append total row - no sorting needed after this
-    pareto_make_with_total = pd.concat([pareto_make_renamed, total_row_pareto_make], ignore_index=True)
+    # Pareto tables: sorted by failure contribution, TOTAL row last
+    pareto_type_with_total = _pareto_table(type_summary, type_total)
+    pareto_make_with_total = _pareto_table(make_summary, make_total)
+    pareto_type = pareto_type_with_total[:-1]
+    pareto_make = pareto_make_with_total[:-1]
 
     insights = []
-    if not type_summary.empty:
-        top_type = type_summary.sort_values("Failure %", ascending=False).iloc[0]
+    if type_summary:
+        top_type = descending(type_summary, key=lambda record: record["Failure %"])[0]
         insights.append(f"✔️ Highest failing damper type: '{top_type['TYPE OF DAMPER']}' with {top_type['Failure %']}% failure rate.")
 
-    if not make_summary.empty:
-        top_make = make_summary.sort_values("Failure %", ascending=False).iloc[0]
+    if make_summary:
+        top_make = descending(make_summary, key=lambda record: record["Failure %"])[0]
         insights.append(f"✔️ Make with highest failure rate: '{top_make['Make']}' at {top_make['Failure %']}%.")
 
-    if (type_summary["Failure %"] > 10).any():
-        high_fail_types = type_summary[type_summary["Failure %"] > 10]["TYPE OF DAMPER"].tolist()
+    high_fail_types = [record["TYPE OF DAMPER"] for record in type_summary if record["Failure %"] > 10]
+    if high_fail_types:
         insights.append("⚠️ Damper types >10% failure: " + ", ".join(high_fail_types))
     else:
         insights.append("✅ All damper types are within acceptable limits (<10% failure).")
 
     # Now we include a hint to let the frontend know what columns to use for the tables
-    return jsonify({
+    return {
         "title": f"Failure Analysis for Age Group: {age_group}",
         "makeDatasets": make_datasets,
         "matrixLabels": unique_types,
         "pieChart": pie_data,
         "pieChart_makeWise": pie_make_data,
         "paretoChart": {
-            "labels": pareto_type["TYPE OF DAMPER"].tolist(),
-            "values": pareto_type["Failure Contribution %"].tolist(),
-            "cumulative": pareto_type["Cumulative"].tolist(),
+            "labels": [record["TYPE OF DAMPER"] for record in pareto_type],
+            "values": [record["Failure Contribution %"] for record in pareto_type],
+            "cumulative": [record["Cumulative"] for record in pareto_type],
         },
         "paretoChart_makeWise": {
-            "labels": pareto_make["Make"].tolist(),
-            "values": pareto_make["Failure Contribution %"].tolist(),
-            "cumulative": pareto_make["Cumulative"].tolist(),
+            "labels": [record["Make"] for record in pareto_make],
+            "values": [record["Failure Contribution %"] for record in pareto_make],
+            "cumulative": [record["Cumulative"] for record in pareto_make],
         },
         "insights": insights,
         "tableData": {
-            "type": type_summary_with_total.to_dict(orient="records"),
-            "make": make_summary_with_total.to_dict(orient="records"),
-            "matrix": matrix_with_total.to_dict(orient="records"),
-            "paretoType": pareto_type_with_total.to_dict(orient="records"),
-            "paretoMake": pareto_make_with_total.to_dict(orient="records")
+            "type": type_summary + [type_total],
+            "make": make_summary + [make_total],
+            "matrix": matrix_with_total,
+            "paretoType": pareto_type_with_total,
+            "paretoMake": pareto_make_with_total
         },
         # Include column specifications for the tables (though the frontend might ignore this)
         "tableColumns": {
@@ -237,33 +158,38 @@ def age_group_analysis():
             "paretoType": ["TYPE OF DAMPER", "Failures", "Total_Receipts", "Failure %", "Failure Contribution %", "Cumulative", "Cumulative Failure %", "Normalized Cumulative %"],
             "paretoMake": ["Make", "Failures", "Total_Receipts", "Failure %", "Failure Contribution %", "Cumulative", "Cumulative Failure %", "Normalized Cumulative %"]
         }
-    })
+    }, 200
+
+@chart_age_bp.route("/chart_age")
+def chart_age():
+    return render_template("chart_age.html")
+
+@chart_age_bp.route("/age_group_analysis")
+@conditional()
+@memoized()
+def age_group_analysis():
+    age_group = request.args.get("group", "").strip()
+    start_date = session.get('start_date', None)
+    end_date = session.get('end_date', None)
+
+    cube, error = get_failure_cube()
+    if error:
+        return jsonify({"error": str(error)}), 500
+
+    # Filter by date
+    with stage("filter"):
+        counts = cube.period(start_date, end_date)
+    with stage("aggregate"):
+        payload, status = age_group_chart_payload(ChartCounts(counts), age_group)
+    with stage("render"):
+        return jsonify(payload), status
 
 # Add this route to your chart_age_bp Blueprint
 @chart_age_bp.route('/get_all_age_groups')
 def get_all_age_groups():
-    df, error = get_google_sheets_data()
+    values, error = dimension_values("Age Group")
     if error:
         return jsonify({"age_groups": [], "error": str(error)}), 500
 
-    if "Age Group" not in df.columns:
-        df["Age"] = df["Age"].astype(str).str.replace(" days", "", regex=True).str.strip()
-        df["Age"] = pd.to_numeric(df["Age"], errors="coerce")
-
-        def categorize_age(days):
-            if pd.isna(days):
-                return "3-5 years"
-            days = int(days)
-            if days < 730:
-                return "Less than 2 years"
-            elif 730 <= days < 1095:
-                return "2-3 years"
-            elif 1095 <= days < 1825:
-                return "3-5 years"
-            else:
-                return "Above 5 years"
-
-        df["Age Group"] = df["Age"].apply(categorize_age)
-
-    age_groups = ["ALL"] + sorted(df["Age Group"].dropna().unique().tolist())
+    age_groups = ["ALL"] + (values or [])
     return jsonify({"age_groups": age_groups})
\ No newline at end of file
@@ -0,0 +1,80 @@
+from .cube import DIMENSIONS
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+def round2(value):
+    # Same rounding as pandas' Series.round(2)
+    return float(np.round(value, 2))
+
+
+def percent(part, whole):
+    # part / whole * 100 as the pandas summaries compute it (NaN for 0 / 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return round2(np.float64(part) / np.float64(whole) * 100)
+
+
+def descending(items, key):
+    # items sorted like DataFrame.sort_values(key, ascending=False), ties included
+    values = np.asarray([key(item) for item in items])
+    order = len(items) - 1 - np.argsort(values[::-1], kind="quicksort")
+    return [items[i] for i in order[::-1]]
+
+
+def pareto(totals):
+    # (labels, failures, cumulative % of all failures), most failures first
+    ordered = descending(totals, key=lambda total: total[1])
+    total = sum(failures for _, failures, _ in ordered)
+    cumulative = []
+    running = 0
+    for _, failures, _ in ordered:
+        running += failures
+        cumulative.append(percent(running, total))
+    return [label for label, _, _ in ordered], [failures for _, failures, _ in ordered], cumulative
+
+
+def _label_order(column):
+    # Position of each label in the order groupby sorts that column by
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return {label: code for code, label in enumerate(column.cat.categories)}
+    return {label: rank for rank, label in enumerate(sorted(column.dropna().unique()))}
+
+
+class ChartCounts:
+    """Failures and receipts per Make x Type x Age Group for one period.
+
+    Built once from cube.period() counts, which already hold one row per
+    combination. Every chart payload (one chart or a whole dashboard) is
+    sliced and summed from these rows in plain Python instead of running
+    its own set of groupbys.
+    """
+
+    def __init__(self, counts, failures="Failures"):
+        self.rows = list(zip(*(counts[dim].tolist() for dim in DIMENSIONS),
+                             counts[failures].tolist(), counts["Receipts"].tolist()))
+        self._order = {dim: _label_order(counts[dim]) for dim in DIMENSIONS}
+
+    def rows_for(self, dimension, label):
+        position = DIMENSIONS.index(dimension)
+        return [row for row in self.rows if row[position] == label]
+
+    def totals(self, rows, by):
+        """[(label, failures, receipts)] per value of `by` over `rows`.
+
+        Like summarize(counts, by): a list `by` gives tuples of labels, and
+        the groups come in the order pandas' groupby returns them.
+        """
+        dims = [by] if isinstance(by, str) else by
+        positions = [DIMENSIONS.index(dim) for dim in dims]
+        sums = {}
+        for row in rows:
+            key = tuple(row[position] for position in positions)
+            if any(label != label for label in key):
+                continue  # NaN labels are dropped by groupby
+            failures, receipts = sums.get(key, (0, 0))
+            sums[key] = (failures + row[3], receipts + row[4])
+        orders = [self._order[dim] for dim in dims]
+        keys = sorted(sums, key=lambda key: tuple(order[label] for order, label in zip(orders, key)))
+        return [(key[0] if isinstance(by, str) else key, *sums[key]) for key in keys]
@@ -1,87 +1,37 @@
 from flask import Blueprint, jsonify, render_template, request
-import pandas as pd
-import numpy as np
-from .utils import get_google_sheets_data
+from .utils import dimension_values, get_failure_cube, memoized, conditional
+from .chart_counts import ChartCounts, percent, pareto
+from .normalize import canonical_value
+from .timing import stage
 
 chart_make_bp = Blueprint("chart_make_bp", __name__)
 
-@chart_make_bp.route("/chart_make")
-def chart_make():
-    # This route renders the template with the chart
-    return render_template("chart_make.html")
+def make_chart_payload(chart_counts, make):
+    # Chart data for one make from a ChartCounts; returns (payload, status)
+    rows = chart_counts.rows_for("Make", canonical_value("Make", make))
 
-@chart_make_bp.route("/chart_make_analysis")
-def chart_make_analysis():
-    make = request.args.get("make", "").strip()
-    df, error = get_google_sheets_data()
-    
-    if error:
-        return jsonify({"error": f"Google Sheets Error: {error}"}), 500
-    
-    if df.empty or "Make" not in df.columns:
-        return jsonify({"error": "No valid data found!"}), 404
-    
-    # Categorize age if needed
-    if "Age Group" not in df.columns:
-        df["Age"] = df["Age"].astype(str).str.replace(" days", "", regex=True).str.strip()
-        df["Age"] = pd.to_numeric(df["Age"], errors="coerce")
-
-        def categorize_age(days):
-            if pd.isna(days) or days == "":
-                return "3-5 years"
-            days = int(days)
-            if days < 730:
-                return "Less than 2 years"
-            elif 730 <= days < 1095:
-                return "2-3 years"
-            elif 1095 <= days < 1825:
-                return "3-5 years"
-            else:
-                return "Above 5 years"
-
-        df["Age Group"] = df["Age"].apply(categorize_age)
-
-    # Filter the dataframe
-    df_filtered = df[
-        (df['Make'].str.strip().str.upper() == make.upper()) &
-        (df['TYPE OF DAMPER'].notna()) &
-        (df['Age Group'].notna())
-    ].copy()
-
-    if df_filtered.empty:
-        return jsonify({"error": f"No data found for Make: {make}"}), 404
-
-    # Add failure and total count columns
-    df_filtered["Failed"] = (df_filtered["Test Result"] == "FAIL").astype(int)
-    df_filtered["Total"] = 1
-
-    # Summary by Type and Age Group
-    summary = df_filtered.groupby(["TYPE OF DAMPER", "Age Group"]).agg(
-        Failures=('Failed', 'sum'),
-        Total_Receipts=('Total', 'sum')
-    ).reset_index()
-
-    if summary.empty:
-        return jsonify({"error": f"Not enough valid data to generate charts for Make: {make}"}), 404
-
-    summary["Failure %"] = (summary["Failures"] / summary["Total_Receipts"] * 100).round(2)
-
-    # Summary by Damper Type
-    damper_summary = summary.groupby("TYPE OF DAMPER").agg(
-        Failures=('Failures', 'sum'),
-        Total_Receipts=('Total_Receipts', 'sum')
-    ).reset_index()
-    damper_summary["Failure %"] = (damper_summary["Failures"] / damper_summary["Total_Receipts"] * 100).round(2)
-
-    if damper_summary.empty:
-        return jsonify({"error": f"Not enough valid damper data for Make: {make}"}), 404
+    if not rows:
+        return {"error": f"No data found for Make: {make}"}, 404
+
+    # Failure % by Type and Age Group
+    summary = {key: percent(failures, receipts)
+               for key, failures, receipts in chart_counts.totals(rows, ["TYPE OF DAMPER", "Age Group"])}
+
+    if not summary:
+        return {"error": f"Not enough valid data to generate charts for Make: {make}"}, 404
+
+    # Summary by Damper Type (alphabetical)
+    damper_summary = sorted(chart_counts.totals(rows, "TYPE OF DAMPER"))
+
+    if not damper_summary:
+        return {"error": f"Not enough valid damper data for Make: {make}"}, 404
 
     # Chart Data
-    unique_age_groups = sorted(summary["Age Group"].unique())
-    unique_dampers = sorted(damper_summary["TYPE OF DAMPER"].unique())
+    unique_age_groups = sorted({age_group for _, age_group in summary})
+    unique_dampers = [damper for damper, _, _ in damper_summary]
 
-    labels = damper_summary["TYPE OF DAMPER"].tolist()
-    values = damper_summary["Failure %"].tolist()
+    labels = unique_dampers
+    values = [percent(failures, receipts) for _, failures, receipts in damper_summary]
 
     # Bar datasets by age group
     age_datasets = []
@@ -91,55 +41,32 @@ def chart_make_analysis():
               'rgba(199, 199, 199, 0.7)', 'rgba(83, 102, 255, 0.7)']
 
     for i, age_group in enumerate(unique_age_groups):
-        age_data = summary[summary["Age Group"] == age_group]
         dataset = {
             "label": age_group,
             "backgroundColor": colors[i % len(colors)],
-            "data": []
+            "data": [summary.get((damper, age_group), 0) for damper in unique_dampers]
         }
-        for damper in unique_dampers:
-            damper_age_data = age_data[age_data["TYPE OF DAMPER"] == damper]
-            if not damper_age_data.empty:
-                dataset["data"].append(damper_age_data["Failure %"].values[0])
-            else:
-                dataset["data"].append(0)
         age_datasets.append(dataset)
 
     # Pie and Pareto charts by Age
-    age_summary = df_filtered.groupby("Age Group").agg(
-        Failures=('Failed', 'sum'),
-        Total_Receipts=('Total', 'sum')
-    ).reset_index()
-    age_summary["Failure %"] = (age_summary["Failures"] / age_summary["Total_Receipts"] * 100).round(2)
-
-    pie_labels = age_summary["Age Group"].tolist()
-    pie_values = age_summary["Failure %"].tolist()
-    pie_colors = [colors[i % len(colors)] for i in range(len(pie_labels))]
+    age_summary = chart_counts.totals(rows, "Age Group")
 
-    sorted_age_summary = age_summary.sort_values("Failures", ascending=False)
-    sorted_age_summary["Cumulative Failures"] = sorted_age_summary["Failures"].cumsum()
-    sorted_age_summary["Cumulative %"] = (sorted_age_summary["Cumulative Failures"] / sorted_age_summary["Failures"].sum() * 100).round(2)
+    pie_labels = [age_group for age_group, _, _ in age_summary]
+    pie_values = [percent(failures, receipts) for _, failures, receipts in age_summary]
+    pie_colors = [colors[i % len(colors)] for i in range(len(pie_labels))]
 
-    pareto_labels = sorted_age_summary["Age Group"].tolist()
-    pareto_values = sorted_age_summary["Failures"].tolist()
-    pareto_cumulative = sorted_age_summary["Cumulative %"].tolist()
+    pareto_labels, pareto_values, pareto_cumulative = pareto(age_summary)
 
     # Type pie
-    pie_type_labels = damper_summary["TYPE OF DAMPER"].tolist()
-    pie_type_values = damper_summary["Failure %"].tolist()
+    pie_type_labels = labels
+    pie_type_values = values
     pie_type_colors = [colors[i % len(colors)] for i in range(len(pie_type_labels))]
 
     # Pareto for Make vs Type
-    pareto_make_type = damper_summary.sort_values("Failures", ascending=False)
-    pareto_make_type["Cumulative Failures"] = pareto_make_type["Failures"].cumsum()
-    pareto_make_type["Cumulative %"] = (pareto_make_type["Cumulative Failures"] / pareto_make_type["Failures"].sum() * 100).round(2)
-
-    pareto_make_labels = pareto_make_type["TYPE OF DAMPER"].tolist()
-    pareto_make_values = pareto_make_type["Failures"].tolist()
-    pareto_make_cumulative = pareto_make_type["Cumulative %"].tolist()
+    pareto_make_labels, pareto_make_values, pareto_make_cumulative = pareto(damper_summary)
 
     # Final response
-    return jsonify({
+    return {
         "labels": labels or [],
         "values": values or [],
         "ageDatasets": age_datasets or [],
@@ -170,8 +97,8 @@ def chart_make_analysis():
             "title": f"Pareto Analysis of Failures by Age Group for Make: {make}"
         },
         "barChart_ageWise": {
-            "labels": age_summary["Age Group"].tolist(),
-            "values": age_summary["Failure %"].tolist(),
+            "labels": pie_labels,
+            "values": pie_values,
             "title": f"Failure % by Age Group for Make: {make}"
         },
         "pieChart_typeWise": {
@@ -186,13 +113,38 @@ def chart_make_analysis():
             "cumulative": pareto_make_cumulative or [],
             "title": f"Pareto Chart: Make {make} vs Damper Type"
         }
-    })
+    }, 200
+
+@chart_make_bp.route("/chart_make")
+def chart_make():
+    # This route renders the template with the chart
+    return render_template("chart_make.html")
+
+@chart_make_bp.route("/chart_make_analysis")
+@conditional()
+@memoized()
+def chart_make_analysis():
+    make = request.args.get("make", "").strip()
+    cube, error = get_failure_cube()
+    
+    if error:
+        return jsonify({"error": f"Google Sheets Error: {error}"}), 500
+    
+    if cube.empty:
+        return jsonify({"error": "No valid data found!"}), 404
+    
+    with stage("filter"):
+        counts = cube.period()
+    with stage("aggregate"):
+        payload, status = make_chart_payload(ChartCounts(counts), make)
+    with stage("render"):
+        return jsonify(payload), status
 
 @chart_make_bp.route('/get_all_makes')
 def get_all_makes():
-    df, error = get_google_sheets_data()
+    makes, error = dimension_values("Make")
     if error:
         return jsonify({"makes": [], "error": str(error)}), 500
 
-    makes = sorted(df["Make"].dropna().unique().tolist())
+    makes = makes or []
     return jsonify({"makes": makes})
@@ -0,0 +1,95 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli  # Optional: preferred over gzip when installed and accepted
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as they are
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+# Compressed bodies kept so identical (e.g. memoized) responses are not recompressed
+COMPRESS_CACHE_ENTRIES = int(os.getenv("COMPRESS_CACHE_ENTRIES", "128"))
+
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/plain", "text/css", "text/csv",
+    "application/json", "application/javascript", "text/javascript",
+}
+
+
+class CompressedBodies:
+    # LRU of compressed bodies keyed by (hash of the body, encoding)
+
+    def __init__(self, max_entries=COMPRESS_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compress(self, body, encoding):
+        key = (hashlib.sha1(body).digest(), encoding)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        data = _compress(body, encoding)
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+compressed_bodies = CompressedBodies()
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def _negotiate():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    # after_request hook: gzip / brotli for large text responses
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    encoding = _negotiate()
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.set_data(compressed_bodies.get_or_compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # The bytes differ per encoding, so a strong validator becomes weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
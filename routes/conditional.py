@@ -0,0 +1,55 @@
+import hashlib
+import functools
+from datetime import datetime, timezone
+from flask import Response, current_app, request, session
+from .memo import request_key
+
+
+def view_etag(key, version):
+    return hashlib.sha1(repr((key, version)).encode("utf-8")).hexdigest()[:20]
+
+
+def conditional_view(current_version, changed_at):
+    """Decorator adding ETag / Last-Modified validators to a JSON view.
+
+    The ETag hashes the request key (endpoint, parameters, session period)
+    and the dataset version, so a matching If-None-Match is answered with
+    304 before the view runs. `changed_at()` is when the data last changed
+    (Last-Modified). If-Modified-Since on its own cannot tell two session
+    periods apart, so it is only honoured when no period is selected.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = current_version()
+            if version is None:
+                return view(*args, **kwargs)
+
+            key = request_key()
+            etag = view_etag(key + (tuple(sorted(kwargs.items())),), version)
+            modified = datetime.fromtimestamp(int(changed_at()), tz=timezone.utc)
+
+            if request.if_none_match:
+                # Weak comparison: compressed responses carry W/ validators
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since and not (session.get("start_date") or session.get("end_date")):
+                not_modified = modified <= request.if_modified_since
+            else:
+                not_modified = False
+
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = modified
+            # Caches may keep the payload but must revalidate it every time;
+            # the period lives in the session, so responses vary by cookie
+            response.headers["Cache-Control"] = "no-cache"
+            response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
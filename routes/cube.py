@@ -0,0 +1,120 @@
+from .lazy import lazy_import
+from .timing import stage
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# Dimensions every analysis slices the failure counts by
+DIMENSIONS = ["Make", "TYPE OF DAMPER", "Age Group"]
+REQUIRED_COLUMNS = DIMENSIONS + ["Test Result"]
+MEASURES = ["Failures", "Not_Passed", "Receipts"]
+CUBE_COLUMNS = DIMENSIONS + ["Test Day"] + MEASURES
+
+
+def daily_counts(df):
+    """Count receipts and failures per Make x Type x Age Group x test day.
+
+    "Failures" counts results equal to FAIL, "Not_Passed" everything that is
+    not PASS (used by the /filter report). Rows without a test date keep a
+    NaT day. Combinations are kept in order of first appearance in the sheet.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=CUBE_COLUMNS)
+
+    if "Test date time" in df.columns:
+        test_day = df["Test date time"].dt.normalize()
+    else:
+        test_day = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+
+    result = df["Test Result"]
+    counts = pd.DataFrame({
+        "Failures": (result == "FAIL").astype(int),
+        "Not_Passed": (result != "PASS").astype(int),
+        "Receipts": 1,
+    })
+    keys = [df[dim] for dim in DIMENSIONS] + [test_day.rename("Test Day")]
+    return counts.groupby(keys, observed=True, dropna=False, sort=False).sum().reset_index()
+
+
+class FailureCube:
+    """Failure/receipt counts per dimension combination with a per-day prefix sum.
+
+    `_cumulative[i]` holds, for every combination, the counts of all test days
+    before `days[i]`, so the counts for any date range are two row lookups
+    and a subtraction. Rows without a parseable test date are kept in a
+    separate `_undated` bucket: they count when no period is selected and
+    can never fall inside one.
+    """
+
+    def __init__(self, combos, days, cumulative, undated):
+        self.combos = combos
+        self.days = days
+        self._cumulative = cumulative
+        self._undated = undated
+
+    @classmethod
+    def from_daily(cls, daily):
+        combos = daily[DIMENSIONS].drop_duplicates().reset_index(drop=True)
+        combo_ids = daily.groupby(DIMENSIONS, observed=True, sort=False).ngroup().to_numpy()
+        values = daily[MEASURES].to_numpy(dtype=np.int64)
+
+        dated = daily["Test Day"].notna().to_numpy()
+        days = pd.DatetimeIndex(daily.loc[dated, "Test Day"].unique()).sort_values()
+        day_ids = days.searchsorted(daily.loc[dated, "Test Day"])
+
+        # Row 0 stays zero so that cumulative[i] is the sum over days[:i]
+        per_day = np.zeros((len(days) + 1, len(combos), len(MEASURES)), dtype=np.int64)
+        per_day[day_ids + 1, combo_ids[dated]] = values[dated]
+        cumulative = np.cumsum(per_day, axis=0)
+
+        undated = np.zeros((len(combos), len(MEASURES)), dtype=np.int64)
+        np.add.at(undated, combo_ids[~dated], values[~dated])
+        return cls(combos, days, cumulative, undated)
+
+    @property
+    def empty(self):
+        return self.combos.empty
+
+    def period(self, start_date=None, end_date=None):
+        # Counts per combination for test days within [start_date, end_date]
+        # (both inclusive); without a period every row counts, dated or not
+        if not start_date or not end_date:
+            totals = self._cumulative[-1] + self._undated
+        else:
+            start = self.days.searchsorted(pd.Timestamp(start_date).normalize(), side="left")
+            end = self.days.searchsorted(pd.Timestamp(end_date).normalize(), side="right")
+            totals = self._cumulative[end] - self._cumulative[start]
+
+        counts = self.combos.copy()
+        counts[MEASURES] = totals
+        return counts[counts["Receipts"] > 0]
+
+    def undated(self):
+        # Counts of the rows that have no parseable test date
+        counts = self.combos.copy()
+        counts[MEASURES] = self._undated
+        return counts[counts["Receipts"] > 0]
+
+
+def build_failure_cube(df):
+    # Built once per data refresh; the routes answer every request from it
+    # instead of grouping the raw test records
+    with stage("aggregate"):
+        return FailureCube.from_daily(daily_counts(df))
+
+
+def missing_columns(df):
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+
+def summarize(counts, by, failures="Failures"):
+    # Failures / receipts per combination of the `by` dimensions. The labels
+    # come back as plain strings: summaries are small and the routes append
+    # "TOTAL" rows to them, which a categorical column would reject.
+    summary = counts.groupby(by, observed=True).agg(
+        Failures=(failures, "sum"),
+        Total_Receipts=("Receipts", "sum")
+    ).reset_index()
+    for column in [by] if isinstance(by, str) else by:
+        summary[column] = summary[column].astype(object)
+    return summary
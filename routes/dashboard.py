@@ -0,0 +1,74 @@
+import os
+from flask import Blueprint, jsonify, request, session
+from .utils import get_failure_cube, memoized, conditional
+from .chart_make import make_chart_payload
+from .chart_type import type_chart_payload
+from .chart_age import age_group_chart_payload
+from .chart_counts import ChartCounts
+from .timing import stage
+
+dashboard_bp = Blueprint("dashboard_bp", __name__)
+
+# Upper bound on the number of charts one batch request may ask for
+DASHBOARD_MAX_ITEMS = int(os.getenv("DASHBOARD_MAX_ITEMS", "100"))
+
+
+def _requested(name):
+    # ?makes=A,B or ?makes=A&makes=B (or both); order kept, duplicates dropped
+    values = []
+    for raw in request.args.getlist(name):
+        for value in raw.split(","):
+            value = value.strip()
+            if value and value not in values:
+                values.append(value)
+    return values
+
+
+@dashboard_bp.route("/dashboard_charts")
+@conditional()
+@memoized()
+def dashboard_charts():
+    """Several chart payloads in one response.
+
+    Takes lists of makes, types and/or age groups and returns, for each,
+    the payload /chart_make_analysis, /chart_type_analysis or
+    /age_group_analysis would return for it (error payloads included).
+    The cube counts are grouped once per period into a ChartCounts and
+    every chart is summed from those rows.
+    """
+    makes = _requested("makes")
+    types = _requested("types")
+    age_groups = _requested("age_groups")
+
+    if not (makes or types or age_groups):
+        return jsonify({"error": "Pass at least one of makes, types or age_groups."}), 400
+    if len(makes) + len(types) + len(age_groups) > DASHBOARD_MAX_ITEMS:
+        return jsonify({"error": f"At most {DASHBOARD_MAX_ITEMS} charts per request."}), 400
+
+    cube, error = get_failure_cube()
+    if error:
+        return jsonify({"error": f"Google Sheets Error: {error}"}), 500
+    if cube.empty:
+        return jsonify({"error": "No valid data found!"}), 404
+
+    result = {}
+    if makes:
+        # Make charts cover every date, as /chart_make_analysis does
+        with stage("filter"):
+            counts = cube.period()
+        with stage("aggregate"):
+            chart_counts = ChartCounts(counts)
+            result["makes"] = {make: make_chart_payload(chart_counts, make)[0] for make in makes}
+
+    if types or age_groups:
+        with stage("filter"):
+            counts = cube.period(session.get("start_date"), session.get("end_date"))
+        with stage("aggregate"):
+            chart_counts = ChartCounts(counts)
+            if types:
+                result["types"] = {t: type_chart_payload(chart_counts, t)[0] for t in types}
+            if age_groups:
+                result["age_groups"] = {g: age_group_chart_payload(chart_counts, g)[0] for g in age_groups}
+
+    with stage("render"):
+        return jsonify(result)
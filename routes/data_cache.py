@@ -0,0 +1,224 @@
+import os
+import logging
+import time
+import threading
+import hashlib
+from collections import OrderedDict
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+# How long (seconds) a fetched dataset is considered fresh. Older data is still
+# served immediately while a single background thread refreshes it.
+CACHE_TTL = float(os.getenv("SHEET_CACHE_TTL", "300"))
+# Dataset versions kept in memory so requests pinned to one keep reading it
+DATA_VERSIONS_KEPT = int(os.getenv("DATA_VERSIONS_KEPT", "3"))
+
+
+def dataset_fingerprint(df):
+    # Short content hash used as the dataset version
+    if df.empty:
+        return "empty"
+    row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False).values
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update("|".join(map(str, df.columns)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class DatasetCache:
+    """Process-wide cache for the sheet data with stale-while-revalidate.
+
+    The first caller loads the data synchronously; afterwards callers always
+    get the cached frame at once, and a stale frame triggers one background
+    refresh. The loader is called with the currently cached frame (or None)
+    and may return that same object to signal that nothing changed.
+
+    The last `versions_kept` versions stay available through get_version(),
+    so a flow of requests can keep reading the version it started with.
+    `versioner(df)` names the version of each newly fetched frame; the
+    default hashes every row, so loaders that can tell what changed more
+    cheaply should pass their own.
+    """
+
+    def __init__(self, loader, ttl=CACHE_TTL, versions_kept=DATA_VERSIONS_KEPT, versioner=dataset_fingerprint):
+        self._loader = loader
+        self._versioner = versioner
+        self.ttl = ttl
+        self.versions_kept = max(1, versions_kept)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._expired = False
+        self._retry_at = 0
+        self._df = None
+        self.loaded_at = None
+        self.version = None
+        # When the content (version) last changed, as opposed to the last fetch
+        self.changed_at = None
+        self.last_error = None
+        self._listeners = []
+        # version -> (df, loaded_at), oldest first
+        self._history = OrderedDict()
+        # (name, version) -> derived value
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def age(self):
+        if self.loaded_at is None:
+            return None
+        return time.time() - self.loaded_at
+
+    def get(self):
+        # Returns (df, error, age_in_seconds)
+        df = self._df
+        if df is None:
+            return self._load_blocking()
+
+        age = self.age()
+        if (self._expired or age > self.ttl) and time.time() >= self._retry_at:
+            self._refresh_in_background()
+        return df, None, age
+
+    def get_version(self, version=None):
+        # Like get(), but returns the data of `version` while it is kept, and
+        # the version actually returned: (df, error, age, version)
+        df, error, age = self.get()
+        if error:
+            return df, error, age, None
+        with self._lock:
+            if version in self._history:
+                df, loaded_at = self._history[version]
+                return df, None, time.time() - loaded_at, version
+            return self._df, None, age, self.version
+
+    def has_version(self, version):
+        return version in self._history
+
+    def derived(self, name, builder, version=None):
+        # builder(df) computed once per dataset version (e.g. aggregates);
+        # `version` selects a kept older version instead of the current one
+        with self._lock:
+            if version in self._history:
+                df = self._history[version][0]
+            else:
+                df, version = self._df, self.version
+        if df is None:
+            return None
+        key = (name, version)
+        cached = self._derived.get(key)
+        if cached is not None:
+            return cached
+        with self._derived_lock:
+            cached = self._derived.get(key)
+            if cached is None:
+                cached = builder(df)
+                if version in self._history:
+                    self._derived[key] = cached
+        return cached
+
+    def add_refresh_listener(self, callback):
+        # callback(df, version, loaded_at) runs after every successful fetch
+        self._listeners.append(callback)
+
+    def seed(self, df, version, loaded_at):
+        # Preload data obtained elsewhere (e.g. a local snapshot). It is served
+        # like any other cached data and refreshed once it is older than the TTL.
+        with self._lock:
+            if self._df is not None:
+                return False
+            self._df = df
+            self.loaded_at = loaded_at
+            self.version = version
+            self.changed_at = loaded_at
+            self._remember(df, version, loaded_at)
+        return True
+
+    def _remember(self, df, version, loaded_at):
+        # Called with _lock held
+        self._history[version] = (df, loaded_at)
+        self._history.move_to_end(version)
+        while len(self._history) > self.versions_kept:
+            self._history.popitem(last=False)
+        for key in list(self._derived):
+            if key[1] not in self._history:
+                self._derived.pop(key, None)
+
+    def invalidate(self, refresh=True):
+        # Mark the cached data as expired; the next get() refreshes it
+        with self._lock:
+            self._expired = True
+            self._retry_at = 0
+        if refresh and self._df is not None:
+            self._refresh_in_background()
+
+    def stats(self):
+        return {
+            "loaded": self._df is not None,
+            "rows": 0 if self._df is None else len(self._df),
+            "version": self.version,
+            "versions_kept": list(self._history),
+            "age_seconds": self.age(),
+            "ttl_seconds": self.ttl,
+            "expired": self._expired,
+            "refreshing": self._refreshing,
+            "last_error": self.last_error,
+        }
+
+    def _store(self, df):
+        # Called with _load_lock held; the version is worked out before taking
+        # _lock so readers never wait for it
+        unchanged = df is self._df
+        version = None if unchanged else self._versioner(df)
+        with self._lock:
+            self._df = df
+            self.loaded_at = time.time()
+            if not unchanged and version != self.version:
+                self.version = version
+                self.changed_at = self.loaded_at
+            self.last_error = None
+            self._expired = False
+            loaded_at, version = self.loaded_at, self.version
+            self._remember(self._df, version, loaded_at)
+        for callback in self._listeners:
+            try:
+                callback(df, version, loaded_at)
+            except Exception as e:
+                logger.exception(f"Dataset refresh listener failed: {e}")
+
+    def _load_blocking(self):
+        # Only one thread fetches on a cold cache; the others wait and reuse it
+        with self._load_lock:
+            if self._df is not None:
+                return self._df, None, self.age()
+            df, error = self._loader(None)
+            if error:
+                self.last_error = error
+                return df, error, None
+            self._store(df)
+            return self._df, None, 0.0
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="dataset-refresh", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            with self._load_lock:
+                df, error = self._loader(self._df)
+                if error:
+                    # Keep serving the previous data; back off before retrying
+                    logger.warning(f"Background refresh failed, serving stale data: {error}")
+                    with self._lock:
+                        self.last_error = error
+                        self._retry_at = time.time() + min(self.ttl, 60)
+                    return
+                self._store(df)
+                logger.info(f"Dataset refreshed ({len(df)} rows, version {self.version}).")
+        finally:
+            with self._lock:
+                self._refreshing = False
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from .cube import DIMENSIONS
+from .data_cache import DATA_VERSIONS_KEPT
+
+
+def dimension_counts(df, columns=DIMENSIONS):
+    # {column: {value: rows}} for the columns present in df (missing values skipped)
+    index = {}
+    for column in columns:
+        if column not in df.columns:
+            continue
+        counts = df[column].value_counts(sort=False, dropna=True)
+        counts = counts[counts > 0]
+        index[column] = {value: int(n) for value, n in sorted(counts.items())}
+    return index
+
+
+class DimensionIndex:
+    """Distinct makes, types and age groups with their row counts.
+
+    Built from the dataset whenever a new version is loaded, so the
+    dropdown endpoints can list their options without reading the data.
+    The indexes of the last `max_versions` versions are kept for requests
+    pinned to an older version.
+    """
+
+    def __init__(self, max_versions=DATA_VERSIONS_KEPT):
+        self.max_versions = max(1, max_versions)
+        self._indexes = OrderedDict()
+        self.version = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    def update(self, df, version, loaded_at=None):
+        # Usable as a dataset refresh listener
+        index = self._indexes.get(version)
+        if index is None:
+            index = dimension_counts(df)
+        with self._lock:
+            self._indexes[version] = index
+            self._indexes.move_to_end(version)
+            while len(self._indexes) > self.max_versions:
+                self._indexes.popitem(last=False)
+            self.version = version
+
+    def resolve(self, version=None):
+        # `version` if its index is kept, else the latest version
+        return version if version in self._indexes else self.version
+
+    def _index(self, version):
+        return self._indexes.get(self.resolve(version), {})
+
+    def values(self, column, version=None):
+        # Sorted distinct values, or None when the column is not in the data
+        counts = self._index(version).get(column)
+        return None if counts is None else list(counts)
+
+    def counts(self, column, version=None):
+        counts = self._index(version).get(column)
+        return None if counts is None else dict(counts)
+
+    def stats(self):
+        index = self._index(None)
+        return {
+            "version": self.version,
+            "versions": list(self._indexes),
+            "values": {column: len(counts) for column, counts in index.items()},
+        }
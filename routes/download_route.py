@@ -1,25 +1,72 @@
 import os
+import logging
 from flask import Blueprint, request, session, send_file, current_app
+from .utils import get_google_sheets_data
+from .export import requested_format, format_error, report_table_response, frame_response
+from .report_store import report_store_for
+from .normalize import canonical_value
+from .timing import stage
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
 
 download_bp = Blueprint("download", __name__)
 
 REPORT_FOLDER = "reports"  # Ensure this folder path is defined properly.
+report_store = report_store_for(REPORT_FOLDER)
+
+def filtered_rows():
+    # Raw test records for the session period, optionally narrowed with
+    # ?make=, ?type= and ?age_group=
+    df, error = get_google_sheets_data()
+    if error:
+        return None, error
+
+    start_date = session.get("start_date")
+    end_date = session.get("end_date")
+    with stage("filter"):
+        if start_date and end_date and "Test date time" in df.columns:
+            # Whole days, end day included (same as the analyses)
+            test_day = df["Test date time"].dt.normalize()
+            df = df[(test_day >= pd.Timestamp(start_date)) & (test_day <= pd.Timestamp(end_date))]
+
+        for arg, column in (("make", "Make"), ("type", "TYPE OF DAMPER"), ("age_group", "Age Group")):
+            value = request.args.get(arg, "").strip()
+            if value and value.upper() != "ALL" and column in df.columns:
+                df = df[df[column] == (value if column == "Age Group" else canonical_value(column, value))]
+    return df, None
 
 @download_bp.route("/download")
 def download():
+    # ?format=xlsx (default) | csv | parquet
+    fmt = requested_format()
+    if fmt is None:
+        return format_error()
+
+    # Filtered raw rows instead of a generated report
+    if request.args.get("rows") == "raw":
+        df, error = filtered_rows()
+        if error:
+            return f"Google Sheets Error: {error}", 500
+        return frame_response(df, fmt, "Damper_Test_Records")
+
     # Check if analysis file is requested via query parameter
     analysis_file = request.args.get("file")
     if analysis_file:
+        if fmt != "xlsx":
+            return report_table_response(report_store, os.path.basename(analysis_file), fmt)
         file_path = os.path.join(REPORT_FOLDER, analysis_file)
         
         # Debugging: Check the file path
-        print(f"Requested file path: {file_path}")
+        logger.info(f"Requested file path: {file_path}")
         
         # Ensure the file is within the REPORT_FOLDER to avoid security risks
         if os.path.exists(file_path):
             return send_file(file_path, as_attachment=True)
         else:
-            print(f"File not found: {file_path}")
+            logger.warning(f"File not found: {file_path}")
             return "File not found.", 404
 
     # Fall back to session-stored report file
@@ -27,13 +74,16 @@ def download():
     if not report_file:
         return "No report available in session. Please generate a report first.", 404
     
+    if fmt != "xlsx":
+        return report_table_response(report_store, os.path.basename(report_file), fmt)
+
     # Fix path construction to avoid double 'reports' directory
     report_file_path = os.path.join(REPORT_FOLDER, report_file)  # This should work
-    print(f"Stored report file path: {report_file_path}")
+    logger.info(f"Stored report file path: {report_file_path}")
 
     # Ensure the file is within the REPORT_FOLDER
     if os.path.exists(report_file_path):
         return send_file(report_file_path, as_attachment=True)
     
-    print(f"Stored report file not found: {report_file_path}")
+    logger.warning(f"Stored report file not found: {report_file_path}")
     return "Stored report file not found.", 404
@@ -0,0 +1,85 @@
+import os
+import itertools
+import functools
+from .lazy import lazy_import
+
+openpyxl = lazy_import("openpyxl")
+
+# Rows inspected to size the columns; everything after them is streamed
+WIDTH_SAMPLE_ROWS = int(os.getenv("EXCEL_WIDTH_SAMPLE_ROWS", "500"))
+
+
+@functools.lru_cache(maxsize=None)
+def _font(size=None):
+    # Bold fonts, created on first use so openpyxl loads with the first report
+    return openpyxl.styles.Font(bold=True, size=size)
+
+
+def _missing(value):
+    # NaN / NaT / None become empty cells, as with DataFrame.to_excel
+    return value is None or value != value
+
+
+def frame_rows(df, index=False):
+    # Rows of `df` as plain lists, produced one at a time
+    for row in df.itertuples(index=index, name=None):
+        yield [None if _missing(value) else value for value in row]
+
+
+def frame_columns(df, index=False, index_label=None):
+    columns = [str(col) for col in df.columns]
+    if index:
+        columns.insert(0, index_label or df.index.name or "")
+    return columns
+
+
+def _styled(ws, value, font):
+    cell = openpyxl.cell.WriteOnlyCell(ws, value=value)
+    cell.font = font
+    return cell
+
+
+def write_table(path, columns, rows, sheet_name="Sheet1", heading=None, heading_column=1,
+                merge_heading=True, blank_rows_after_heading=0, auto_width_from=None,
+                bold_first_column=False):
+    """Write a header row plus `rows` to an .xlsx file in write-only mode.
+
+    Rows are streamed to disk as they are consumed, so memory use does not
+    grow with the number of rows. Optional extras:
+    - heading: a title in the first row at `heading_column`, bold and merged
+      across the table when merge_heading is set
+    - auto_width_from: 1-based column from which the column widths are set
+      from the longest value (header and the first WIDTH_SAMPLE_ROWS rows)
+    - bold_first_column: bold labels in the first column (index-like)
+    """
+    get_column_letter = openpyxl.utils.get_column_letter
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    rows = iter(rows)
+
+    if auto_width_from is not None:
+        # Widths must be set before the first row is written
+        sample = list(itertools.islice(rows, WIDTH_SAMPLE_ROWS))
+        for i in range(auto_width_from - 1, len(columns)):
+            longest = max([len(str(row[i])) for row in sample if row[i] is not None] + [len(str(columns[i]))])
+            ws.column_dimensions[get_column_letter(i + 1)].width = longest + 2
+        rows = itertools.chain(sample, rows)
+
+    if heading is not None:
+        if merge_heading:
+            ws.append([None] * (heading_column - 1) + [_styled(ws, heading, _font(14))])
+            ws.merged_cells.add(
+                f"{get_column_letter(heading_column)}1:{get_column_letter(max(len(columns), heading_column))}1"
+            )
+        else:
+            ws.append([None] * (heading_column - 1) + [heading])
+        for _ in range(blank_rows_after_heading):
+            ws.append([])
+
+    ws.append([_styled(ws, col, _font()) for col in columns])
+    for row in rows:
+        if bold_first_column and row:
+            row = [_styled(ws, row[0], _font())] + list(row[1:])
+        ws.append(row)
+
+    wb.save(path)
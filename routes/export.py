@@ -0,0 +1,105 @@
+import io
+import os
+from flask import Response, jsonify, request, send_file, stream_with_context
+from .excel_writer import write_table, frame_columns, frame_rows
+from .timing import stage
+from .lazy import lazy_import
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+EXPORT_FORMATS = ("xlsx", "csv", "parquet")
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+# Rows rendered per chunk of a streamed CSV response
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+# Report tables are stored next to the report files, as Parquet, for the
+# CSV / Parquet downloads; every worker can read them
+TABLE_EXTENSION = "parquet"
+
+
+def requested_format(default="xlsx"):
+    # ?format=xlsx|csv|parquet; None if the value is not supported
+    fmt = request.args.get("format", default).lower()
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+def format_error():
+    return jsonify({"error": f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+
+
+def csv_response(df, download_name):
+    # Streamed in chunks of CSV_CHUNK_ROWS rows; nothing is written to disk
+    def generate():
+        yield df.iloc[:0].to_csv(index=False)
+        for start in range(0, len(df), CSV_CHUNK_ROWS):
+            yield df.iloc[start:start + CSV_CHUNK_ROWS].to_csv(index=False, header=False)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=\"{download_name}.csv\""},
+    )
+
+
+def arrow_table(df):
+    # Converted column by column through Arrow, without openpyxl
+    return pa.Table.from_pandas(_arrow_ready(df), preserve_index=False)
+
+
+def parquet_response(df, download_name):
+    buffer = io.BytesIO()
+    pq.write_table(arrow_table(df), buffer)
+    buffer.seek(0)
+    return send_file(buffer, mimetype=PARQUET_MIMETYPE,
+                     as_attachment=True, download_name=f"{download_name}.parquet")
+
+
+def xlsx_response(df, download_name):
+    buffer = io.BytesIO()
+    write_table(buffer, frame_columns(df), frame_rows(df))
+    buffer.seek(0)
+    return send_file(buffer, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                     as_attachment=True, download_name=f"{download_name}.xlsx")
+
+
+def _arrow_ready(df):
+    # Arrow needs one type per column; summary tables mix ints and labels
+    out = df.copy()
+    out.columns = [str(col) for col in out.columns]
+    for col in out.columns:
+        if out[col].dtype == object:
+            values = out[col]
+            out[col] = values.astype(str).where(values.notna(), None)
+    return out
+
+
+def frame_response(df, fmt, download_name):
+    # A streamed CSV is rendered after the response starts, outside "export"
+    with stage("export"):
+        if fmt == "csv":
+            return csv_response(df, download_name)
+        if fmt == "parquet":
+            return parquet_response(df, download_name)
+        return xlsx_response(df, download_name)
+
+
+def table_writer(df):
+    # write(path) storing a report's table for report_table_response()
+    def write(path):
+        pq.write_table(arrow_table(df), path)
+    return write
+
+
+def report_table_response(store, filename, fmt):
+    # CSV / Parquet version of a generated report, from the table stored
+    # next to it in `store` (same name, TABLE_EXTENSION)
+    table_filename = f"{os.path.splitext(filename)[0]}.{TABLE_EXTENSION}"
+    if not store.lookup(table_filename):
+        return "Report data is no longer available. Please generate the report again.", 404
+    path = os.path.join(store.folder, table_filename)
+    download_name = os.path.splitext(filename)[0]
+    with stage("export"):
+        if fmt == "parquet":
+            return send_file(path, mimetype=PARQUET_MIMETYPE,
+                             as_attachment=True, download_name=f"{download_name}.parquet")
+        return csv_response(pq.read_table(path).to_pandas(), download_name)
@@ -1,75 +1,40 @@
 import os
-import pandas as pd
-import numpy as np
 from flask import Blueprint, request, render_template, session, send_file
-from .utils import get_google_sheets_data  # ✅ Use shared utility
+from .utils import get_failure_cube, memoized, current_data_version  # ✅ Use shared utility
+from .report_store import report_store_for, report_key
+from .excel_writer import write_table, frame_columns, frame_rows
+from .export import requested_format, format_error, report_table_response, table_writer, TABLE_EXTENSION
+from .cube import summarize
+from .normalize import AGE_GROUPS
+from .timing import stage
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
 
 index_bp = Blueprint("index", __name__)
 REPORT_FOLDER = "reports"
-os.makedirs(REPORT_FOLDER, exist_ok=True)
-
-def clean_and_convert_age(age):
-    if pd.isna(age) or age == "":
-        return np.nan
-    if isinstance(age, str):
-        age = age.replace(' days', '').strip()
-    try:
-        return int(age)
-    except ValueError:
-        return np.nan
-
-def categorize_age(days):
-    if pd.isna(days) or days == "":
-        return "3-5 years"
-    try:
-        days = int(days)
-    except ValueError:
-        return "3-5 years"
-    if days < 730:
-        return "Less than 2 years"
-    elif 730 <= days < 1095:
-        return "2-3 years"
-    elif 1095 <= days < 1825:
-        return "3-5 years"
-    else:
-        return "Above 5 years"
+report_store = report_store_for(REPORT_FOLDER)
 
 @index_bp.route("/", methods=["GET", "POST"])
+@memoized(session_keys=("report_file",))
 def index():
-    df, error = get_google_sheets_data()
+    cube, error = get_failure_cube()
     if error:
         return error
 
-    # Strip whitespace from column names
-    df.columns = df.columns.str.strip()
-
-    required_columns = ['Make', 'TYPE OF DAMPER', 'Age', 'Test Result']
-    missing = [col for col in required_columns if col not in df.columns]
-    if missing:
-        return f"Error: Missing required columns - {', '.join(missing)}"
-
-    # Apply cleaning
-    df['Age'] = df['Age'].apply(clean_and_convert_age)
-    df['Age'] = df['Age'].fillna(1460)
-    df['Age Group'] = df['Age'].apply(categorize_age)
-    df['Make'] = df['Make'].fillna("Unknown")
-    df['TYPE OF DAMPER'] = df['TYPE OF DAMPER'].fillna("Unknown")
-
-    # 🔍 Period Filter using 'Test date time' if present
-    if "Test date time" in df.columns:
-        df["Test date time"] = pd.to_datetime(df["Test date time"], errors="coerce")
-        start_date = session.get("start_date")
-        end_date = session.get("end_date")
-        if start_date and end_date:
-            try:
-                df = df[(df["Test date time"] >= start_date) & (df["Test date time"] <= end_date)]
-            except Exception as e:
-                return f"Date filtering error: {str(e)}"
+    # 🔍 Period Filter on the test day
+    start_date = session.get("start_date")
+    end_date = session.get("end_date")
+    try:
+        with stage("filter"):
+            counts = cube.period(start_date, end_date)
+    except Exception as e:
+        return f"Date filtering error: {str(e)}"
 
     # Dropdown options
-    makes = ["ALL"] + sorted(df['Make'].dropna().unique().tolist()) + ["NONE"]
-    dampers = ["ALL"] + sorted(df['TYPE OF DAMPER'].dropna().unique().tolist()) + ["NONE"]
-    age_groups = ["ALL", "Less than 2 years", "2-3 years", "3-5 years", "Above 5 years", "NONE"]
+    makes = ["ALL"] + sorted(counts['Make'].dropna().unique().tolist()) + ["NONE"]
+    dampers = ["ALL"] + sorted(counts['TYPE OF DAMPER'].dropna().unique().tolist()) + ["NONE"]
+    age_groups = ["ALL"] + AGE_GROUPS + ["NONE"]
 
     # Get filters from form
     make = request.form.get("make", "ALL")
@@ -77,15 +42,16 @@ def index():
     damper_type = request.form.get("damper_type", "ALL")
 
     # Filter
-    filtered_df = df.copy()
-    if make != "ALL" and make != "NONE":
-        filtered_df = filtered_df[filtered_df['Make'] == make]
-    if damper_type != "ALL" and damper_type != "NONE":
-        filtered_df = filtered_df[filtered_df['TYPE OF DAMPER'] == damper_type]
-    if age_group != "ALL" and age_group != "NONE":
-        filtered_df = filtered_df[filtered_df['Age Group'] == age_group]
-
-    if filtered_df.empty:
+    with stage("filter"):
+        filtered = counts
+        if make != "ALL" and make != "NONE":
+            filtered = filtered[filtered['Make'] == make]
+        if damper_type != "ALL" and damper_type != "NONE":
+            filtered = filtered[filtered['TYPE OF DAMPER'] == damper_type]
+        if age_group != "ALL" and age_group != "NONE":
+            filtered = filtered[filtered['Age Group'] == age_group]
+
+    if filtered.empty:
         return "No data available for the selected filters."
 
     selected_columns = []
@@ -99,39 +65,51 @@ def index():
     if not selected_columns:
         return "No valid columns selected for grouping."
 
-    result = filtered_df.groupby(selected_columns, dropna=False).agg(
-        Number_of_Receipts=('Test Result', 'count'),
-        Number_of_Failures=('Test Result', lambda x: (x != 'PASS').sum())
-    ).reset_index()
+    with stage("aggregate"):
+        result = summarize(filtered, selected_columns, failures="Not_Passed").rename(columns={
+            "Total_Receipts": "Number_of_Receipts",
+            "Failures": "Number_of_Failures",
+        })[selected_columns + ["Number_of_Receipts", "Number_of_Failures"]]
 
-    result['Failure Percentage'] = (result['Number_of_Failures'] / result['Number_of_Receipts']) * 100
+        result['Failure Percentage'] = (result['Number_of_Failures'] / result['Number_of_Receipts']) * 100
 
-    total_row = pd.DataFrame({
-        selected_columns[0]: ['Total'],
-        'Number_of_Receipts': [result['Number_of_Receipts'].sum()],
-        'Number_of_Failures': [result['Number_of_Failures'].sum()],
-        'Failure Percentage': [result['Number_of_Failures'].sum() / result['Number_of_Receipts'].sum() * 100]
-    })
+        total_row = pd.DataFrame({
+            selected_columns[0]: ['Total'],
+            'Number_of_Receipts': [result['Number_of_Receipts'].sum()],
+            'Number_of_Failures': [result['Number_of_Failures'].sum()],
+            'Failure Percentage': [result['Number_of_Failures'].sum() / result['Number_of_Receipts'].sum() * 100]
+        })
 
-    result = pd.concat([result, total_row], ignore_index=True)
+        result = pd.concat([result, total_row], ignore_index=True)
 
-    # Save filtered report
-    report_file = os.path.join(REPORT_FOLDER, "Filtered_Damper_Data.xlsx")
-    result.to_excel(report_file, index=False, engine='openpyxl')
-    session["report_file"] = "Filtered_Damper_Data.xlsx"
-
-    return render_template("index.html",
-        data=result.to_html(index=False, classes="table table-bordered"),
-        makes=makes,
-        dampers=dampers,
-        age_groups=age_groups
+    # Save filtered report (reused as long as filters, period and data are the same)
+    key = report_key("filter", make, damper_type, age_group, start_date, end_date, current_data_version())
+    session["report_file"] = report_store.get_or_create(
+        "Filtered_Damper_Data", key,
+        lambda path: write_table(path, frame_columns(result), frame_rows(result))
     )
+    # Kept next to the workbook for the CSV / Parquet downloads
+    report_store.get_or_create("Filtered_Damper_Data", key, table_writer(result), extension=TABLE_EXTENSION)
+
+    with stage("render"):
+        return render_template("index.html",
+            data=result.to_html(index=False, classes="table table-bordered"),
+            makes=makes,
+            dampers=dampers,
+            age_groups=age_groups
+        )
 
 @index_bp.route("/download")
 def download():
+    # ?format=xlsx (default) | csv | parquet
+    fmt = requested_format()
+    if fmt is None:
+        return format_error()
     report_file = session.get("report_file")
     if not report_file:
         return "No report available. Please generate a report first.", 404
+    if fmt != "xlsx":
+        return report_table_response(report_store, report_file, fmt)
 
     file_path = os.path.join(REPORT_FOLDER, report_file)
 
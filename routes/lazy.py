@@ -0,0 +1,36 @@
+import os
+import importlib
+
+# Set LAZY_IMPORTS=0 to import pandas, openpyxl, gspread etc. at startup again
+LAZY_IMPORTS = os.getenv("LAZY_IMPORTS", "1") == "1"
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    Keeps heavy libraries off the startup path: `pd = lazy_import("pandas")`
+    costs nothing until `pd.DataFrame` (or any other attribute) is used.
+    The import itself goes through importlib, whose per-module locks make
+    concurrent first uses from several threads safe, and dotted names
+    ("pyarrow.parquet") work like a plain `import`.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    if not LAZY_IMPORTS:
+        return importlib.import_module(name)
+    return LazyModule(name)
@@ -0,0 +1,31 @@
+import os
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+# Read the damper log from a local .csv / .parquet file instead of the Google
+# Sheet (benchmarks, offline development). Unset: the sheet is used.
+DATA_FILE = os.getenv("DAMPER_DATA_FILE")
+
+
+class LocalDataFile:
+    # Stand-in for the sheet; the file is read again only when it changes
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+
+    def fetch(self, previous=None):
+        # Returns (frame, changed); an unchanged file returns `previous`
+        mtime = os.path.getmtime(self.path)
+        if previous is not None and mtime == self._mtime:
+            return previous, False
+        if self.path.endswith(".parquet"):
+            df = pd.read_parquet(self.path)
+        else:
+            df = pd.read_csv(self.path)
+        self._mtime = mtime
+        return df, True
+
+
+local_data_file = LocalDataFile(DATA_FILE) if DATA_FILE else None
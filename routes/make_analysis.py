@@ -1,32 +1,26 @@
 import os
-import pandas as pd
 from flask import Blueprint, request, render_template, session, send_file, redirect, url_for
-from .utils import get_google_sheets_data  # ✅ Use shared utility
+from .utils import dimension_values, get_failure_cube, memoized, current_data_version, queue_report  # ✅ Use shared utility
+from .report_store import report_store_for, report_key
+from .excel_writer import write_table, frame_columns, frame_rows
+from .export import requested_format, format_error, report_table_response
+from .pivot import failure_pivot
+from .normalize import canonical_value
+from .timing import stage
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
 
 make_analysis_bp = Blueprint("make_analysis", __name__)
 REPORT_FOLDER = "reports"
-os.makedirs(REPORT_FOLDER, exist_ok=True)
-
-def categorize_age(age_days):
-    try:
-        age_days = float(age_days)
-        if age_days < 730:
-            return "Less than 2 years"
-        elif age_days < 1095:
-            return "2-3 years"
-        elif age_days < 1825:
-            return "3-5 years"
-        else:
-            return "Above 5 years"
-    except ValueError:
-        return "Above 5 years"
+report_store = report_store_for(REPORT_FOLDER)
 
 @make_analysis_bp.route("/select_make", methods=["GET", "POST"])
 def select_make():
-    df, error = get_google_sheets_data()
+    makes, error = dimension_values("Make")
     if error:
         return error
-    makes = ["ALL"] + sorted(df['Make'].dropna().unique().tolist()) + ["NONE"]
+    makes = ["ALL"] + (makes or []) + ["NONE"]
     if request.method == "POST":
         make = request.form.get("make")
         return redirect(url_for('make_analysis.analyze_make', value=make))
@@ -34,14 +28,16 @@ def select_make():
     return render_template("select_make.html", makes=makes)
 
 @make_analysis_bp.route("/analyze_make", methods=["GET"])
+@memoized(session_keys=("report_file",))
 def analyze_make():
-    make = request.args.get("value")
-    df, error = get_google_sheets_data()
+    make = (request.args.get("value") or "").strip()
+    if not make:
+        return f"No data available for Make: {make}", 404
+    # Matched, keyed and shown the way the column stores it (aliases included)
+    make_label = canonical_value("Make", make)
+    cube, error = get_failure_cube()
     if error:
         return error
-    
-    # ✅ Ensure 'Test date time' column is converted to datetime
-    df["Test date time"] = pd.to_datetime(df["Test date time"], errors="coerce")
 
     # ✅ Retrieve date range from session
     start_date = session.get("start_date")
@@ -56,88 +52,25 @@ def analyze_make():
     except ValueError:
         return "Invalid date format in session."
 
-    # ✅ Filter the dataframe based on the selected date range
-    df = df[(df["Test date time"] >= start_dt) & (df["Test date time"] <= end_dt)]
+    # ✅ Filter the counts based on the selected date range
+    with stage("filter"):
+        counts = cube.period(start_dt, end_dt)
 
-    required_columns = ['Make', 'TYPE OF DAMPER', 'Age', 'Test Result']
-    missing = [col for col in required_columns if col not in df.columns]
-    if missing:
-        return f"Error: Missing required columns - {', '.join(missing)}"
-    
-    df["Age"] = df["Age"].astype(str).str.replace(" days", "", regex=True).str.strip()
-    df["Age"] = df["Age"].apply(lambda x: 1460 if x == "" or not x.isnumeric() else float(x))
-    df["Age Group"] = df["Age"].apply(categorize_age)
+        if make_label != "ALL" and make_label != "NONE":
+            counts = counts[counts['Make'] == make_label]
     
-    if make != "ALL" and make != "NONE":
-        df_filtered = df[df['Make'] == make].copy()
-    else:
-        df_filtered = df.copy()
-    
-    if df_filtered.empty:
+    if counts.empty:
         return f"No data available for Make: {make}"
     
-    df_filtered["Failed"] = (df_filtered["Test Result"] == "FAIL").astype(int)
-    df_filtered["Total"] = 1
-    
-    summary = df_filtered.groupby(["TYPE OF DAMPER", "Age Group"]).agg(
-        Failures=('Failed', 'sum'),
-        Total_Receipts=('Total', 'sum')
-    ).reset_index()
-    
-    damper_types = df_filtered["TYPE OF DAMPER"].unique().tolist()
-    columns_age_groups = ["Less than 2 years", "2-3 years", "3-5 years", "Above 5 years", "Total"]
-    columns_metrics = ["Failures", "Total", "Failure %"]
-    
-    column_tuples = [(age, metric) for age in columns_age_groups for metric in columns_metrics]
-    column_index = pd.MultiIndex.from_tuples(column_tuples)
-    final_table = pd.DataFrame(index=damper_types, columns=column_index)
-    
-    for damper_type in damper_types:
-        for age_group in columns_age_groups[:-1]:
-            subset = summary[(summary['TYPE OF DAMPER'] == damper_type) & (summary['Age Group'] == age_group)]
-            failures = subset['Failures'].sum() if not subset.empty else 0
-            total = subset['Total_Receipts'].sum() if not subset.empty else 0
-            failure_pct = (failures / total * 100) if total > 0 else 0
-            
-            final_table.loc[damper_type, (age_group, 'Failures')] = int(failures)
-            final_table.loc[damper_type, (age_group, 'Total')] = int(total)
-            final_table.loc[damper_type, (age_group, 'Failure %')] = f"{failure_pct:.2f}%"
-        
-        damper_subset = summary[summary['TYPE OF DAMPER'] == damper_type]
-        total_failures = damper_subset['Failures'].sum()
-        total_receipts = damper_subset['Total_Receipts'].sum()
-        total_percent = (total_failures / total_receipts * 100) if total_receipts > 0 else 0
-        
-        final_table.loc[damper_type, ('Total', 'Failures')] = int(total_failures)
-        final_table.loc[damper_type, ('Total', 'Total')] = int(total_receipts)
-        final_table.loc[damper_type, ('Total', 'Failure %')] = f"{total_percent:.2f}%"
-    
-    final_table.loc['All Types'] = pd.Series(dtype='object')
-    
-    for age_group in columns_age_groups[:-1]:
-        age_subset = summary[summary['Age Group'] == age_group]
-        age_failures = age_subset['Failures'].sum()
-        age_total = age_subset['Total_Receipts'].sum()
-        age_percent = (age_failures / age_total * 100) if age_total > 0 else 0
-        
-        final_table.loc['All Types', (age_group, 'Failures')] = int(age_failures)
-        final_table.loc['All Types', (age_group, 'Total')] = int(age_total)
-        final_table.loc['All Types', (age_group, 'Failure %')] = f"{age_percent:.2f}%"
-    
-    total_failures = summary['Failures'].sum()
-    total_receipts = summary['Total_Receipts'].sum()
-    total_percent = (total_failures / total_receipts * 100) if total_receipts > 0 else 0
-    
-    final_table.loc['All Types', ('Total', 'Failures')] = int(total_failures)
-    final_table.loc['All Types', ('Total', 'Total')] = int(total_receipts)
-    final_table.loc['All Types', ('Total', 'Failure %')] = f"{total_percent:.2f}%"
-    
-    final_table = final_table.fillna(0).infer_objects(copy=False)
-    display_table = final_table.reset_index().rename(columns={'index': 'TYPE OF DAMPER'})
+    with stage("aggregate"):
+        # Types in the order they first appear in the sheet, as this page lists them
+        final_table = failure_pivot(counts, "TYPE OF DAMPER", total_label="All Types", sort=False)
+        display_table = final_table.reset_index().rename(columns={'index': 'TYPE OF DAMPER'})
     
     # Heading for web page
-    make_heading = f"<h4><strong>Failure Analysis for Make: <span style='color:#3c6382'>{make}</span></strong></h4>"
-    table_html = display_table.to_html(classes="table table-bordered table-hover", escape=False, index=False)
+    make_heading = f"<h4><strong>Failure Analysis for Make: <span style='color:#3c6382'>{make_label}</span></strong></h4>"
+    with stage("render"):
+        table_html = display_table.to_html(classes="table table-bordered table-hover", escape=False, index=False)
     
     table_html = f"""
     <style>
@@ -180,37 +113,50 @@ def analyze_make():
     """
     
     # Save to Excel with heading
-    safe_make = "".join(c if c.isalnum() else "_" for c in make)
-    report_file = os.path.join(REPORT_FOLDER, f"Make_Analysis_{safe_make}.xlsx")
-    
-    with pd.ExcelWriter(report_file, engine='openpyxl') as writer:
-        flat_columns = [f"{col[0]} - {col[1]}" for col in final_table.columns]
-        final_table_flat = final_table.copy()
-        final_table_flat.columns = flat_columns
-        final_df = final_table_flat.reset_index(names='TYPE OF DAMPER')
-        final_df.to_excel(writer, sheet_name="Summary", index=False, startrow=1)
-        
-        # Merge and format heading in Excel
-        workbook = writer.book
-        worksheet = writer.sheets["Summary"]
-        heading_text = f"Failure Analysis Report for Make: {make}"
-        worksheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(final_df.columns))
-        cell = worksheet.cell(row=1, column=1)
-        cell.value = heading_text
-        cell.font = cell.font.copy(bold=True, size=14)
-    
-    session["report_file"] = report_file
-    
-    return render_template(
-        "analysis_make.html",
-        table_html=table_html,
-        download_link=url_for('make_analysis.download_make_analysis'),
-        make=make
-    )
+    safe_make = "".join(c if c.isalnum() else "_" for c in make_label)
+
+    # Flat "<age group> - <metric>" columns, as written to Excel / CSV / Parquet
+    report_frame = final_table.copy()
+    report_frame.columns = [f"{col[0]} - {col[1]}" for col in final_table.columns]
+    report_frame = report_frame.reset_index(names='TYPE OF DAMPER')
+
+    def write_report(path):
+        # Table under a merged, bold heading
+        write_table(
+            path, frame_columns(report_frame), frame_rows(report_frame),
+            sheet_name="Summary", heading=f"Failure Analysis Report for Make: {make_label}"
+        )
+
+    # Written in the background; the page polls the job until the file is ready
+    key = report_key("make", make_label, start_date, end_date, current_data_version())
+    prefix = f"Make_Analysis_{safe_make}"
+    report_job = queue_report(report_store, prefix, key, write_report,
+                              download_link=url_for('make_analysis.download_make_analysis'),
+                              table=report_frame)
+    
+    report_filename = report_store.filename_for(prefix, key)
+    session["report_file"] = os.path.join(report_store.folder, report_filename)
+    
+    with stage("render"):
+        return render_template(
+            "analysis_make.html",
+            table_html=table_html,
+            download_link=report_job["download_link"],
+            report_job=report_job,
+            make=make_label
+        )
 
 @make_analysis_bp.route("/download_make_analysis")
 def download_make_analysis():
+    # ?format=xlsx (default) | csv | parquet
+    fmt = requested_format()
+    if fmt is None:
+        return format_error()
     report_file = session.get("report_file")
-    if not report_file or not os.path.exists(report_file):
+    if not report_file:
         return "No report available. Please generate a report first.", 404
+    if fmt != "xlsx":
+        return report_table_response(report_store, os.path.basename(report_file), fmt)
+    if not os.path.exists(report_file):
+        return "The report is still being generated (or has expired). Please try again shortly.", 404
     return send_file(report_file, as_attachment=True)
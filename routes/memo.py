@@ -0,0 +1,130 @@
+import os
+import threading
+import functools
+from collections import OrderedDict
+from flask import Response, current_app, request, session
+
+# Maximum number of rendered responses kept per process
+MEMO_MAX_ENTRIES = int(os.getenv("RESULT_MEMO_SIZE", "256"))
+
+
+class ResultMemo:
+    """LRU cache of rendered responses for the latest dataset versions.
+
+    Entries are keyed by the dataset version plus whatever identifies a
+    request (see `request_key`). Only the `versions` most recently seen
+    versions are kept; the entries of older ones are dropped, so a refresh
+    of the sheet never serves stale results.
+    """
+
+    def __init__(self, max_entries=MEMO_MAX_ENTRIES, versions=1):
+        self.max_entries = max_entries
+        self.versions = max(1, versions)
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _see(self, version):
+        # Called with _lock held
+        if version in self._versions:
+            self._versions.move_to_end(version)
+            return
+        self._versions[version] = None
+        while len(self._versions) > self.versions:
+            dropped, _ = self._versions.popitem(last=False)
+            for key in [key for key in self._entries if key[0] == dropped]:
+                del self._entries[key]
+
+    def lookup(self, key, version):
+        key = (version, key)
+        with self._lock:
+            self._see(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def store(self, key, version, value):
+        with self._lock:
+            if version not in self._versions or self.max_entries <= 0:
+                return  # The data changed while the result was computed
+            key = (version, key)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, version, compute):
+        value = self.lookup(key, version)
+        if value is None:
+            value = compute()
+            self.store(key, version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "version": next(reversed(self._versions), None),
+                "versions": list(self._versions),
+            }
+
+
+def request_key():
+    # Endpoint, query/form parameters and the selected period
+    return (
+        request.endpoint,
+        request.method,
+        tuple(sorted(request.args.items(multi=True))),
+        tuple(sorted(request.form.items(multi=True))),
+        session.get("start_date"),
+        session.get("end_date"),
+    )
+
+
+def memoize_view(memo, current_version, session_keys=()):
+    """Decorator serving repeated requests for a view from `memo`.
+
+    `current_version()` returns the dataset version the view would read
+    (None when no data is available; such requests are never cached).
+    Only 200 responses are kept. `session_keys` lists session values the
+    view sets as a side effect; they are stored with the response and
+    restored on a hit.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = current_version()
+            if version is None:
+                return view(*args, **kwargs)
+
+            key = request_key() + (tuple(sorted(kwargs.items())),)
+            cached = memo.lookup(key, version)
+            if cached is not None:
+                body, content_type, saved_session = cached
+                session.update(saved_session)
+                return Response(body, content_type=content_type)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                saved_session = {k: session[k] for k in session_keys if k in session}
+                memo.store(key, version, (response.get_data(), response.content_type, saved_session))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+import time
+from flask import g, request
+from prometheus_client import Counter, Histogram
+
+# Prometheus metrics updated as things happen; cache sizes and hit counts are
+# read from the caches' own stats() when /metrics is scraped (metrics_route.py)
+
+# Seconds; from a memo hit to a full sheet reload
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUESTS = Counter(
+    "damper_http_requests", "HTTP requests handled, by endpoint", ["endpoint", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "damper_http_request_duration_seconds", "HTTP request latency, by endpoint", ["endpoint", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+SHEET_FETCHES = Counter(
+    "damper_sheet_fetches", "Dataset fetches from the Google Sheet (or DAMPER_DATA_FILE)", ["source", "result"]
+)
+SHEET_FETCH_DURATION = Histogram(
+    "damper_sheet_fetch_duration_seconds", "Time to download the dataset, before normalization", ["source"],
+    buckets=LATENCY_BUCKETS,
+)
+SHEET_FETCH_BYTES = Counter(
+    "damper_sheet_fetch_bytes", "Bytes received from the Sheets API (or read from DAMPER_DATA_FILE)", ["source"]
+)
+ROWS_INGESTED = Counter(
+    "damper_rows_ingested", "Rows fetched; incremental syncs count only the appended rows", ["source"]
+)
+REPORT_GENERATION = Histogram(
+    "damper_report_generation_seconds", "Time to write one report file", ["format"],
+    buckets=LATENCY_BUCKETS,
+)
+REPORT_LOOKUPS = Counter(
+    "damper_report_store_lookups", "Report requests served from an existing file (hit) or written (miss)", ["result"]
+)
+
+
+def observe_fetch(source, started, rows, nbytes=None):
+    # A successful fetch that began at time.perf_counter() value `started`
+    SHEET_FETCHES.labels(source, "ok").inc()
+    SHEET_FETCH_DURATION.labels(source).observe(time.perf_counter() - started)
+    ROWS_INGESTED.labels(source).inc(rows)
+    if nbytes is not None:
+        SHEET_FETCH_BYTES.labels(source).inc(nbytes)
+
+
+def count_response_bytes(response, *args, **kwargs):
+    # requests response hook on the gspread session
+    SHEET_FETCH_BYTES.labels("sheet").inc(len(response.content))
+
+
+def start_request_metrics():
+    # before_request hook
+    g.metrics_started = time.perf_counter()
+
+
+def record_request_metrics(response):
+    # after_request hook; the endpoint name keeps the label set small
+    started = g.get("metrics_started")
+    if started is not None:
+        endpoint = request.endpoint or "unmatched"
+        REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+    return response
@@ -0,0 +1,91 @@
+import os
+from flask import Blueprint, Response, current_app
+from prometheus_client import REGISTRY, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from .utils import dataset_cache, result_memo, report_jobs
+from .report_store import all_stores
+from .compression import compressed_bodies
+from .sessions import session_stats
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def _dataset_memory(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _hit_metrics(name, description, stats):
+    hits = CounterMetricFamily(f"damper_{name}_hits", f"{description} hits")
+    hits.add_metric([], stats["hits"])
+    misses = CounterMetricFamily(f"damper_{name}_misses", f"{description} misses")
+    misses.add_metric([], stats["misses"])
+    lookups = stats["hits"] + stats["misses"]
+    ratio = GaugeMetricFamily(f"damper_{name}_hit_ratio", f"{description} hit ratio since start")
+    ratio.add_metric([], stats["hits"] / lookups if lookups else 0)
+    entries = GaugeMetricFamily(f"damper_{name}_entries", f"{description} entries")
+    entries.add_metric([], stats["entries"])
+    return [hits, misses, ratio, entries]
+
+
+class StatsCollector:
+    """Cache and dataset figures read from this worker's caches at scrape time."""
+
+    def describe(self):
+        # Keeps register() from calling collect() outside a request
+        return []
+
+    def collect(self):
+        stats = dataset_cache.stats()
+        yield GaugeMetricFamily("damper_dataset_loaded", "1 once a dataset is loaded", value=int(stats["loaded"]))
+        yield GaugeMetricFamily("damper_dataset_rows", "Rows in the current dataset", value=stats["rows"])
+        yield GaugeMetricFamily("damper_dataset_versions_kept", "Dataset versions held in memory",
+                                value=len(stats["versions_kept"]))
+        if stats["age_seconds"] is not None:
+            yield GaugeMetricFamily("damper_dataset_age_seconds", "Seconds since the dataset was last fetched",
+                                    value=stats["age_seconds"])
+        # Computed once per dataset version
+        memory = dataset_cache.derived("memory_bytes", _dataset_memory)
+        if memory is not None:
+            yield GaugeMetricFamily("damper_dataset_memory_bytes", "Memory used by the current dataset",
+                                    value=memory)
+
+        yield from _hit_metrics("result_memo", "Result memo", result_memo.stats())
+        yield from _hit_metrics("compression_cache", "Compressed response cache", compressed_bodies.stats())
+
+        files = GaugeMetricFamily("damper_report_store_files", "Report files kept", labels=["folder"])
+        size = GaugeMetricFamily("damper_report_store_bytes", "Size of the report files kept", labels=["folder"])
+        for store in all_stores():
+            store_stats = store.stats()
+            files.add_metric([store.folder], store_stats["files"])
+            size.add_metric([store.folder], store_stats["bytes"])
+        yield files
+        yield size
+
+        jobs = GaugeMetricFamily("damper_report_jobs", "Report jobs remembered, by state", labels=["state"])
+        for state, count in report_jobs.stats()["states"].items():
+            jobs.add_metric([state], count)
+        yield jobs
+
+        sessions = session_stats(current_app).get("sessions")
+        if sessions is not None:
+            yield GaugeMetricFamily("damper_sessions", "Server-side sessions stored", value=sessions)
+
+
+REGISTRY.register(StatsCollector())
+
+
+def _registry():
+    # Under gunicorn with PROMETHEUS_MULTIPROC_DIR set, counters and histograms
+    # are summed over every worker; cache figures are this worker's own
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(StatsCollector())
+    return registry
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    # Prometheus text format; no login needed (see require_login in app.py)
+    return Response(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,138 @@
+import os
+import logging
+import re
+import json
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+# Age buckets (in days) used by every analysis
+AGE_GROUPS = ["Less than 2 years", "2-3 years", "3-5 years", "Above 5 years"]
+AGE_BIN_EDGES = [float("-inf"), 730, 1095, 1825, float("inf")]
+# Rows without a usable age are treated as 4 years old ("3-5 years")
+DEFAULT_AGE_DAYS = 1460
+# Category order of the "Age Group" column. This is the plain string order
+# the routes have always produced when grouping, so tables and charts keep
+# their layout.
+AGE_GROUP_ORDER = sorted(AGE_GROUPS)
+
+# Text columns stored as categoricals (small integer codes plus one copy of
+# each distinct label) once their labels are cleaned
+CATEGORICAL_COLUMNS = ["Make", "TYPE OF DAMPER", "Test Result"]
+# Spelling variants merged into one label, per column. Keys and values are
+# compared after stripping, upper-casing and collapsing inner whitespace.
+DEFAULT_ALIASES = {
+    "TYPE OF DAMPER": {
+        "LHB NAC SEC VERTICALDAMPER": "LHB NAC SEC VERTICAL DAMPER",
+    },
+}
+# Optional JSON file with more aliases in the same {column: {variant: label}} shape
+ALIASES_FILE = os.getenv("DAMPER_ALIASES_FILE")
+
+
+def _canonical(labels):
+    return labels.astype(str).str.strip().str.upper().str.replace(r"\s+", " ", regex=True)
+
+
+def _canonical_label(label):
+    # _canonical for a single label, without pandas (aliases load at import)
+    return re.sub(r"\s+", " ", str(label).strip().upper())
+
+
+def load_aliases(path=ALIASES_FILE):
+    aliases = {column: dict(mapping) for column, mapping in DEFAULT_ALIASES.items()}
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                for column, mapping in json.load(f).items():
+                    aliases.setdefault(column, {}).update(mapping)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring alias file {path}: {e}")
+    # Normalize both sides the same way the column labels are
+    return {
+        column: {_canonical_label(variant): _canonical_label(label) for variant, label in mapping.items()}
+        for column, mapping in aliases.items()
+    }
+
+
+ALIASES = load_aliases()
+
+
+def canonical_value(column, value):
+    # A label from a query string (e.g. ?value=) spelled the way
+    # normalize_dataset() stores `column`: cleaned, then merged through ALIASES
+    label = _canonical_label(value)
+    return ALIASES.get(column, {}).get(label, label)
+
+
+def _encode_text(values, aliases=None, missing="Unknown"):
+    # Cleans only the distinct labels (there are a few dozen of them against
+    # thousands of rows) and stores the column as a categorical
+    codes, uniques = pd.factorize(values)
+    labels = _canonical(pd.Index(uniques))
+    if aliases:
+        labels = labels.map(lambda label: aliases.get(label, label))
+    if (codes == -1).any():
+        labels = labels.append(pd.Index([missing]))
+        codes = np.where(codes == -1, len(labels) - 1, codes)
+    # Sorted categories: grouping by the column gives the alphabetical order
+    # the routes have always shown, whatever order the sheet is in
+    label_codes, categories = pd.factorize(labels, sort=True)
+    return pd.Categorical.from_codes(label_codes[codes], categories=categories)
+
+
+def normalize_dataset(df):
+    """Clean a raw sheet frame once so the routes can use it as is.
+
+    - column names are stripped
+    - "Age" ("1200 days", 1200, "" ...) becomes a number of days, with
+      DEFAULT_AGE_DAYS for missing or unparseable values
+    - "Age Group" is derived from "Age" with fixed bin edges
+    - "Test date time" is parsed to datetime (NaT when unparseable)
+    - "Make", "TYPE OF DAMPER" and "Test Result" are stripped, upper-cased,
+      merged through ALIASES and stored as categoricals ("Unknown" when
+      missing)
+    """
+    if df.empty:
+        return df
+
+    df = df.copy()
+    df.columns = df.columns.astype(str).str.strip()
+
+    if "Age" in df.columns:
+        age = df["Age"].astype(str).str.replace(" days", "", regex=False).str.strip()
+        df["Age"] = pd.to_numeric(age, errors="coerce").fillna(DEFAULT_AGE_DAYS)
+        age_group = pd.cut(df["Age"], bins=AGE_BIN_EDGES, labels=AGE_GROUPS, right=False)
+        df["Age Group"] = age_group.cat.reorder_categories(AGE_GROUP_ORDER)
+
+    if "Test date time" in df.columns:
+        df["Test date time"] = pd.to_datetime(df["Test date time"], errors="coerce")
+
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = _encode_text(df[column], ALIASES.get(column))
+
+    return df
+
+
+def append_rows(df, new_rows):
+    # Append freshly synced (already normalized) rows to the cached frame
+    if new_rows.empty:
+        return df
+    if df.empty:
+        return new_rows
+    combined = pd.concat([df, new_rows], ignore_index=True)
+    # concat falls back to object dtype when the categories differ; keep the
+    # columns categorical with the union of both label sets, sorted as
+    # _encode_text sorts them (so an incremental sync matches a full load)
+    for column in combined.columns:
+        if (column in new_rows.columns
+                and isinstance(df[column].dtype, pd.CategoricalDtype)
+                and isinstance(new_rows[column].dtype, pd.CategoricalDtype)):
+            combined[column] = pd.api.types.union_categoricals(
+                [df[column], new_rows[column]], sort_categories=not df[column].cat.ordered
+            )
+    return combined
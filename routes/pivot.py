@@ -0,0 +1,53 @@
+from .normalize import AGE_GROUPS
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# Column layout of the make / type analysis tables
+PIVOT_AGE_COLUMNS = AGE_GROUPS + ["Total"]
+PIVOT_METRICS = ["Failures", "Total", "Failure %"]
+
+
+def _percent(failures, totals):
+    # Failure percentage, 0 where there were no receipts
+    pct = np.zeros(failures.shape)
+    np.divide(failures * 100.0, totals, out=pct, where=totals > 0)
+    return pct
+
+
+def failure_pivot(counts, rows, total_label="Total", failures="Failures", sort=True):
+    """Failures / receipts / failure % per `rows` value x age group.
+
+    `counts` is a frame of cube counts (see FailureCube.period). The result
+    has one row per `rows` value (in the order groupby gives them, or in
+    order of first appearance with sort=False) plus a `total_label` row,
+    and (age group, metric) MultiIndex columns for every age group plus
+    "Total". Counts stay integers until the percentages are formatted as
+    "12.34%" strings at the very end.
+    """
+    grouped = counts.groupby([rows, "Age Group"], observed=True, sort=False)[[failures, "Receipts"]].sum()
+    labels = pd.Index(counts[rows].unique())
+    if sort:
+        labels = labels.sort_values()  # Category order for categoricals
+    labels = labels.astype(object)
+
+    def matrix(measure):
+        table = grouped[measure].unstack("Age Group", fill_value=0)
+        table.index = table.index.astype(object)
+        table.columns = table.columns.astype(object)
+        values = table.reindex(index=labels, columns=AGE_GROUPS, fill_value=0).to_numpy(dtype=np.int64)
+        # Row totals as an extra column, column totals as an extra row
+        values = np.column_stack([values, values.sum(axis=1)])
+        return np.vstack([values, values.sum(axis=0)])
+
+    fail = matrix(failures)
+    total = matrix("Receipts")
+    pct = np.char.add(np.char.mod("%.2f", _percent(fail, total)), "%")
+
+    columns = {}
+    for i, age in enumerate(PIVOT_AGE_COLUMNS):
+        columns[(age, "Failures")] = fail[:, i]
+        columns[(age, "Total")] = total[:, i]
+        columns[(age, "Failure %")] = pct[:, i].astype(object)
+    return pd.DataFrame(columns, index=labels.append(pd.Index([total_label])))
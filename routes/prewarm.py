@@ -0,0 +1,120 @@
+import os
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import session
+from .normalize import AGE_GROUPS
+from .utils import dataset_cache, report_jobs
+
+logger = logging.getLogger(__name__)
+
+# Set PREWARM_ENABLED=1 to precompute every selector's pages after a refresh
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "0") == "1"
+PREWARM_WORKERS = int(os.getenv("PREWARM_WORKERS", "2"))
+# Period to prewarm as "YYYY-MM-DD,YYYY-MM-DD"; empty means no period selected
+PREWARM_PERIOD = os.getenv("PREWARM_PERIOD", "")
+# Progress is printed every this many requests
+PREWARM_LOG_EVERY = int(os.getenv("PREWARM_LOG_EVERY", "10"))
+
+
+def prewarm_requests(df, period=None):
+    # (path, query) for every chart and analysis a selector can ask for
+    makes = sorted(df["Make"].dropna().unique().tolist())
+    types = sorted(df["TYPE OF DAMPER"].dropna().unique().tolist())
+
+    requests = [("/chart_make_analysis", {"make": make}) for make in makes]
+    requests += [("/chart_type_analysis", {"type": t}) for t in ["All"] + types]
+    requests += [("/age_group_analysis", {"group": group}) for group in ["ALL"] + AGE_GROUPS]
+    requests += [("/analyze_type", {"value": t}) for t in types]
+    requests += [("/analyze_age", {"value": group}) for group in AGE_GROUPS]
+    if period:
+        # The make analysis needs a period (it redirects home without one)
+        requests += [("/analyze_make", {"value": make}) for make in ["ALL"] + makes]
+    return requests
+
+
+class Prewarmer:
+    """Runs every selector's chart and analysis view once after a refresh.
+
+    The views are dispatched inside request contexts, so their results land
+    in the result memo (and their Excel reports in the report store) exactly
+    as if a user had asked for them first. One run per dataset version.
+    """
+
+    def __init__(self, workers=PREWARM_WORKERS, period=PREWARM_PERIOD):
+        self.workers = workers
+        self.period = tuple(p.strip() for p in period.split(",")) if period else None
+        self.app = None
+        self._lock = threading.Lock()
+        self._running = False
+        self.last_version = None
+        self.last_run = None
+
+    def init_app(self, app):
+        self.app = app
+        dataset_cache.add_refresh_listener(self.on_refresh)
+
+    def on_refresh(self, df, version, loaded_at):
+        # Refresh listener; the work itself happens on a separate thread
+        self.start(df, version)
+
+    def start(self, df, version):
+        if self.app is None or df.empty:
+            return False
+        with self._lock:
+            if self._running or version == self.last_version:
+                return False
+            self._running = True
+        threading.Thread(target=self._run, args=(df, version), name="prewarm", daemon=True).start()
+        return True
+
+    def _run(self, df, version):
+        started = time.time()
+        done = failed = 0
+        try:
+            requests = prewarm_requests(df, self.period)
+            logger.info(f"Prewarm of version {version} started: {len(requests)} requests, {self.workers} workers.")
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prewarm") as pool:
+                futures = [pool.submit(self._dispatch, path, query) for path, query in requests]
+                for future in as_completed(futures):
+                    done += 1
+                    if not future.result():
+                        failed += 1
+                    if done % PREWARM_LOG_EVERY == 0 or done == len(requests):
+                        logger.info(f"Prewarm progress: {done}/{len(requests)} ({time.time() - started:.1f}s)")
+            # Excel reports are written by the report workers; wait for them too
+            report_jobs.wait()
+            self.last_version = version
+        except Exception as e:
+            logger.exception(f"Prewarm of version {version} failed: {e}")
+        finally:
+            duration = time.time() - started
+            self.last_run = {"version": version, "requests": done, "failed": failed,
+                             "seconds": round(duration, 3), "finished_at": time.time()}
+            with self._lock:
+                self._running = False
+        logger.info(f"Prewarm of version {version} finished in {duration:.1f}s ({failed} failed).")
+
+    def _dispatch(self, path, query):
+        # True when the view answered 200 (and so was memoized)
+        with self.app.test_request_context(path, query_string=query):
+            if self.period:
+                session["start_date"], session["end_date"] = self.period
+            try:
+                response = self.app.make_response(self.app.dispatch_request())
+            except Exception as e:
+                logger.warning(f"Prewarm of {path} {query} failed: {e}")
+                return False
+            return response.status_code == 200
+
+    def stats(self):
+        return {
+            "enabled": self.app is not None,
+            "running": self._running,
+            "period": self.period,
+            "last_run": self.last_run,
+        }
+
+
+prewarmer = Prewarmer()
@@ -0,0 +1,117 @@
+import os
+import logging
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# Worker threads writing Excel reports in the background
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Finished jobs remembered for status polling
+REPORT_JOB_HISTORY = int(os.getenv("REPORT_JOB_HISTORY", "500"))
+
+
+class ReportJobs:
+    """Builds report files on a small thread pool instead of in the request.
+
+    A job is identified by the report's store file name, so submitting the
+    same report (same kind, parameters, period and data version) twice
+    returns the job that is already queued, running or done.
+    """
+
+    def __init__(self, workers=REPORT_WORKERS, history=REPORT_JOB_HISTORY):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._failure_listeners = []
+
+    def add_failure_listener(self, callback):
+        # callback(job) runs after a job failed
+        self._failure_listeners.append(callback)
+
+    def submit(self, store, prefix, key, write, download_link, extra_files=None):
+        # extra_files: {extension: write} for files stored next to the
+        # report under the same key (written first)
+        extra_files = extra_files or {}
+        filename = store.filename_for(prefix, key)
+        job_id = filename.rsplit(".", 1)[0]
+        filenames = [filename] + [store.filename_for(prefix, key, extension) for extension in extra_files]
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or self._state(job) in ("failed", "expired"):
+                job = {
+                    "id": job_id,
+                    "state": "queued",
+                    "download_link": download_link,
+                    "submitted_at": time.time(),
+                    "finished_at": None,
+                    "error": None,
+                    "store": store,
+                    "filenames": filenames,
+                }
+                if all(store.lookup(name) for name in filenames):
+                    job["state"] = "done"
+                    job["finished_at"] = job["submitted_at"]
+                else:
+                    job["future"] = self._executor.submit(self._run, job, store, prefix, key, write, extra_files)
+                self._jobs[job_id] = job
+                while len(self._jobs) > self.history:
+                    self._jobs.popitem(last=False)
+            self._jobs.move_to_end(job_id)
+            return self._public(job)
+
+    def _run(self, job, store, prefix, key, write, extra_files):
+        with self._lock:
+            job["state"] = "running"
+        try:
+            for extension, write_extra in extra_files.items():
+                store.get_or_create(prefix, key, write_extra, extension=extension)
+            store.get_or_create(prefix, key, write)
+        except Exception as e:
+            logger.exception(f"Report job {job['id']} failed: {e}")
+            with self._lock:
+                job.update(state="failed", error=str(e), finished_at=time.time())
+            for callback in self._failure_listeners:
+                callback(job)
+            return
+        with self._lock:
+            job.update(state="done", finished_at=time.time())
+
+    def wait(self, timeout=None):
+        # Block until every job submitted so far has finished
+        with self._lock:
+            futures = [job["future"] for job in self._jobs.values() if job.get("future")]
+        wait(futures, timeout)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def _state(self, job):
+        # A finished report (or a file next to it) may since have been evicted
+        if job["state"] == "done" and not all(job["store"].lookup(name) for name in job["filenames"]):
+            return "expired"
+        return job["state"]
+
+    def _public(self, job):
+        # Copy for the API; the download link is only handed out once the file exists
+        state = self._state(job)
+        end = job["finished_at"] or time.time()
+        return {
+            "id": job["id"],
+            "state": state,
+            "download_link": job["download_link"] if state == "done" else None,
+            "elapsed": round(end - job["submitted_at"], 3),
+            "error": job["error"],
+        }
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job["state"]] = states.get(job["state"], 0) + 1
+            return {"jobs": len(self._jobs), "states": states}
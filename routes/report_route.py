@@ -0,0 +1,33 @@
+from flask import Blueprint, jsonify, request, url_for
+from .utils import report_jobs
+from .report_store import STORE_FILE_PATTERN, all_stores
+
+reports_bp = Blueprint("reports", __name__)
+
+
+def _stored_report(job_id):
+    # True if the report of job `job_id` is in a report store; jobs live in
+    # the memory of the worker that queued them, the files are shared
+    filename = f"{job_id}.xlsx"
+    return bool(STORE_FILE_PATTERN.match(filename)) and any(store.lookup(filename) for store in all_stores())
+
+
+@reports_bp.route("/reports/status/<job_id>")
+def report_status(job_id):
+    # queued / running / done (with download_link) / failed / expired
+    job = report_jobs.status(job_id)
+    if job is None:
+        if not _stored_report(job_id):
+            return jsonify({"id": job_id, "state": "unknown", "error": "No such report job."}), 404
+        # Queued by another worker (or forgotten here) and finished: the
+        # download link comes with the status URL (see queue_report)
+        download_link = request.args.get("download", "")
+        job = {
+            "id": job_id,
+            "state": "done",
+            "download_link": download_link if download_link.startswith("/") and not download_link.startswith("//") else None,
+            "elapsed": None,
+            "error": None,
+        }
+    job["status_url"] = url_for("reports.report_status", job_id=job_id, download=request.args.get("download"))
+    return jsonify(job)
@@ -0,0 +1,147 @@
+import os
+import logging
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from .timing import stage
+from .metrics import REPORT_GENERATION, REPORT_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Limits for the generated report files kept in each report folder
+REPORT_STORE_MAX_BYTES = int(float(os.getenv("REPORT_STORE_MAX_MB", "100")) * 1024 * 1024)
+REPORT_STORE_MAX_AGE = float(os.getenv("REPORT_STORE_MAX_AGE_HOURS", "168")) * 3600
+
+# <prefix>-<16 hex digits>.xlsx; files not matching this are never evicted
+STORE_FILE_PATTERN = re.compile(r"^.+-[0-9a-f]{16}\.[a-z]+$")
+
+_stores = {}
+_stores_lock = threading.Lock()
+_eviction_listeners = []
+
+
+def report_key(*parts):
+    # Stable hash of everything a report depends on
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def add_eviction_listener(callback):
+    # callback() runs after files were evicted from any store
+    _eviction_listeners.append(callback)
+
+
+class ReportStore:
+    """Generated report files named after a hash of their inputs.
+
+    A report is only written when no file with its name exists yet; it is
+    written to a temp file and renamed into place, so concurrent requests
+    never see (or clobber each other with) a half-written workbook.
+    """
+
+    def __init__(self, folder, max_bytes=REPORT_STORE_MAX_BYTES, max_age=REPORT_STORE_MAX_AGE):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def filename_for(self, prefix, key, extension="xlsx"):
+        return f"{prefix}-{key}.{extension}"
+
+    def lookup(self, filename):
+        # True if the report file exists (and marks it as recently used)
+        path = os.path.join(self.folder, filename)
+        try:
+            os.utime(path)  # Most recently used files are evicted last
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get_or_create(self, prefix, key, write, extension="xlsx"):
+        # Returns the file name (relative to the folder) of the report for
+        # `key`, calling write(path) only if it does not exist yet
+        filename = self.filename_for(prefix, key, extension)
+        path = os.path.join(self.folder, filename)
+        if self.lookup(filename):
+            REPORT_LOOKUPS.labels("hit").inc()
+            return filename
+        REPORT_LOOKUPS.labels("miss").inc()
+
+        os.makedirs(self.folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".report-", suffix=f".{extension}", dir=self.folder)
+        os.close(fd)
+        try:
+            # Timed in the request's Server-Timing header, or logged for report jobs
+            started = time.perf_counter()
+            with stage("export"):
+                write(tmp_path)
+            REPORT_GENERATION.labels(extension).observe(time.perf_counter() - started)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+        return filename
+
+    def _files(self):
+        files = []
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and STORE_FILE_PATTERN.match(entry.name):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass  # Created with the first report
+        return sorted(files)
+
+    def evict(self):
+        # Drop files older than max_age, then the least recently used ones
+        # until the folder is within max_bytes
+        with self._lock:
+            files = self._files()
+            now = time.time()
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, path in files:
+                if now - mtime <= self.max_age and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        if removed:
+            logger.info(f"Evicted {removed} report file(s) from {self.folder}.")
+            for callback in _eviction_listeners:
+                callback()
+        return removed
+
+    def stats(self):
+        files = self._files() if os.path.isdir(self.folder) else []
+        return {
+            "folder": self.folder,
+            "files": len(files),
+            "bytes": sum(size for _, size, _ in files),
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+        }
+
+
+def report_store_for(folder):
+    # One store per physical folder, shared by every route writing into it
+    real = os.path.realpath(folder)
+    with _stores_lock:
+        if real not in _stores:
+            _stores[real] = ReportStore(real)
+        return _stores[real]
+
+
+def all_stores():
+    with _stores_lock:
+        return list(_stores.values())
@@ -0,0 +1,203 @@
+import os
+import logging
+import time
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+logger = logging.getLogger(__name__)
+
+# "memory" (per process, no disk I/O), "sqlite" (one local file shared by
+# every worker; use it when several workers serve the same users),
+# "filesystem" (Flask-Session) or "cookie" (signed cookie, nothing stored
+# server side; needs a private SECRET_KEY, see configure_sessions)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+# The secret key app.py falls back to; it is in the repository, so anyone can
+# sign a cookie session with it
+PUBLIC_SECRET_KEY = "secret_key"
+# Sessions kept by the memory backend; the least recently used go first
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_SQLITE_PATH = os.getenv(
+    "SESSION_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sessions.sqlite3"),
+)
+# Expired rows are purged from the sqlite store once every this many writes
+SQLITE_PURGE_EVERY = 500
+
+
+class MemorySessionStore:
+    # sid -> (expires_at, data), in least recently used order
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry[1]
+
+    def set(self, sid, data, ttl):
+        now = time.time()
+        with self._lock:
+            self._entries[sid] = (now + ttl, data)
+            self._entries.move_to_end(sid)
+            # Expired sessions gather at the least recently used end
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or next(iter(self._entries.values()))[0] <= now):
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def stats(self):
+        return {"backend": "memory", "sessions": len(self._entries), "max_entries": self.max_entries}
+
+
+class SqliteSessionStore:
+    """Sessions in a local sqlite file, safe to share between worker processes.
+
+    Reads are a single indexed lookup; rows are only written when the
+    session changes.
+    """
+
+    def __init__(self, path=SESSION_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        # One connection per thread (and process), opened on first use so a
+        # worker forked from a preloaded app never shares its parent's
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT, expires REAL)")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, sid):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, data, ttl):
+        db = self._connect()
+        db.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                   (sid, data, time.time() + ttl))
+        self._writes += 1
+        if self._writes % SQLITE_PURGE_EVERY == 0:
+            db.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+
+    def delete(self, sid):
+        self._connect().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def stats(self):
+        count = self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": "sqlite", "sessions": count, "path": self.path}
+
+
+class StoredSession(SecureCookieSession):
+    # Session whose data lives in a store; the cookie only carries the id
+
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+
+
+class StoreSessionInterface(SessionInterface):
+    """Server-side sessions kept in a MemorySessionStore or SqliteSessionStore.
+
+    Nothing is read for static files, and a session is only written back
+    when it was modified. Entries expire after the app's
+    PERMANENT_SESSION_LIFETIME.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        if app.static_url_path and request.path.startswith(app.static_url_path + "/"):
+            return StoredSession()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.get(sid) if sid else None
+        if data is None:
+            return StoredSession()
+        try:
+            return StoredSession(self.serializer.loads(data), sid=sid)
+        except ValueError:
+            return StoredSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session.modified:
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        ttl = app.permanent_session_lifetime.total_seconds()
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), ttl)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def configure_sessions(app, backend=SESSION_BACKEND):
+    # Installs the session backend selected by SESSION_BACKEND
+    if backend == "memory":
+        app.session_interface = StoreSessionInterface(MemorySessionStore())
+    elif backend == "sqlite":
+        app.session_interface = StoreSessionInterface(SqliteSessionStore())
+    elif backend == "filesystem":
+        from flask_session import Session
+        app.config["SESSION_TYPE"] = "filesystem"
+        Session(app)
+    elif backend == "cookie":
+        # The login flag lives in the cookie itself, so the key must not be public
+        if not os.getenv("SECRET_KEY") or app.secret_key == PUBLIC_SECRET_KEY:
+            raise ValueError("SESSION_BACKEND=cookie needs a private SECRET_KEY environment variable")
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
+    logger.info(f"Using {backend} sessions.")
+
+
+def session_stats(app):
+    store = getattr(app.session_interface, "store", None)
+    if store is not None:
+        return store.stats()
+    return {"backend": SESSION_BACKEND}
@@ -0,0 +1,160 @@
+import os
+import logging
+import json
+import random
+import hashlib
+import threading
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
+gspread = lazy_import("gspread")
+
+logger = logging.getLogger(__name__)
+
+# "incremental" only downloads rows appended since the last sync,
+# "full" re-downloads the whole sheet on every refresh
+SYNC_MODE = os.getenv("SHEET_SYNC_MODE", "incremental")
+# Upper bound on the number of rows requested by one range read
+SYNC_BATCH_ROWS = int(os.getenv("SHEET_SYNC_BATCH_ROWS", "5000"))
+# Already synced rows are checksummed in blocks of this many rows; a few
+# blocks are re-read on every sync to detect edits to earlier rows
+CHECK_BLOCK_ROWS = int(os.getenv("SHEET_SYNC_BLOCK_ROWS", "50"))
+CHECK_SAMPLE_BLOCKS = int(os.getenv("SHEET_SYNC_SAMPLE_BLOCKS", "4"))
+
+
+def _checksum(rows):
+    return hashlib.sha1(json.dumps(rows, separators=(",", ":")).encode("utf-8")).hexdigest()[:16]
+
+
+def _pad(rows, width):
+    # The API trims trailing blanks per row; get_all_records() pads them with ""
+    return [(list(row) + [""] * width)[:width] for row in rows]
+
+
+def _header_checksum(header):
+    # Ignore the blank cells a wider data area adds to the right of the header
+    header = list(header)
+    while header and header[-1] == "":
+        header.pop()
+    return _checksum(header)
+
+
+def _check_header(header):
+    duplicates = sorted({h for h in header if header.count(h) > 1})
+    if duplicates:
+        raise gspread.exceptions.GSpreadException(f"the header row in the worksheet contains duplicates: {duplicates}")
+
+
+def records_frame(header, rows):
+    # Same values get_all_records() would produce, as a DataFrame
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame([gspread.utils.numericise_all(row, empty2zero=False, default_blank="") for row in rows], columns=header)
+
+
+class IncrementalSheetSync:
+    """Tracks how much of an append-only worksheet has already been ingested.
+
+    The state holds the header, the synced row count and a checksum per block
+    of CHECK_BLOCK_ROWS rows (plus the raw rows of the last, partial block).
+    A sync re-reads the partial block, everything after it and a small random
+    sample of full blocks; only if the header or a sampled block changed does
+    it fall back to downloading the whole sheet.
+    """
+
+    def __init__(self, mode=SYNC_MODE):
+        self.mode = mode
+        self.state = None
+        self._lock = threading.Lock()
+
+    def version(self):
+        # Content version of the synced rows (None before the first sync):
+        # header, row count, every block checksum and the partial block, so it
+        # costs one hash over rows / CHECK_BLOCK_ROWS checksums, not the data
+        state = self.state
+        if state is None:
+            return None
+        digest = hashlib.sha1(state["header_hash"].encode())
+        digest.update(f":{state['row_count']}:".encode())
+        digest.update("".join(state["blocks"]).encode())
+        digest.update(_checksum(state["tail"]).encode())
+        return digest.hexdigest()[:16]
+
+    def restore(self, state):
+        # Resume from state saved with a snapshot of the same data
+        self.state = state
+
+    def fetch(self, sheet, previous=None):
+        # Returns (frame, appended): with appended=True the frame only holds new rows
+        with self._lock:
+            if self.mode == "incremental" and self.state is not None and previous is not None:
+                new_rows = self._fetch_new_rows(sheet)
+                if new_rows is not None:
+                    return records_frame(self.state["header"], new_rows), True
+                logger.info("Sheet header or earlier rows changed; doing a full reload.")
+            return self._fetch_all(sheet), False
+
+    def _fetch_all(self, sheet):
+        values = sheet.get(pad_values=True)
+        if not values or values == [[]]:
+            self.state = None
+            return pd.DataFrame()
+        header, rows = values[0], _pad(values[1:], len(values[0]))
+        _check_header(header)
+        self.state = {
+            "header": header,
+            "header_hash": _header_checksum(header),
+            "row_count": 0,
+            "blocks": [],
+            "tail": [],
+        }
+        self._extend_state(rows)
+        return records_frame(header, rows)
+
+    def _extend_state(self, rows):
+        state = self.state
+        pending = state["tail"] + rows
+        full_blocks = len(pending) // CHECK_BLOCK_ROWS
+        for i in range(full_blocks):
+            state["blocks"].append(_checksum(pending[i * CHECK_BLOCK_ROWS:(i + 1) * CHECK_BLOCK_ROWS]))
+        state["tail"] = pending[full_blocks * CHECK_BLOCK_ROWS:]
+        state["row_count"] += len(rows)
+
+    def _fetch_new_rows(self, sheet):
+        # Returns the rows appended since the last sync, or None if a full reload is needed
+        state = self.state
+        width = len(state["header"])
+        tail_start = len(state["blocks"]) * CHECK_BLOCK_ROWS + 2  # sheet row of the first unblocked row
+
+        # Header, sampled blocks and the first batch of new rows in one request
+        sampled = random.sample(range(len(state["blocks"])), min(CHECK_SAMPLE_BLOCKS, len(state["blocks"])))
+        if state["blocks"] and len(state["blocks"]) - 1 not in sampled:
+            sampled.append(len(state["blocks"]) - 1)
+        ranges = ["1:1"]
+        ranges += [f"{b * CHECK_BLOCK_ROWS + 2}:{(b + 1) * CHECK_BLOCK_ROWS + 1}" for b in sampled]
+        ranges.append(f"{tail_start}:{tail_start + SYNC_BATCH_ROWS - 1}")
+        results = sheet.batch_get(ranges)
+
+        header = results[0][0] if results[0] else []
+        if _header_checksum(header) != state["header_hash"]:
+            return None
+        for block, values in zip(sampled, results[1:-1]):
+            if _checksum(_pad(values, width)) != state["blocks"][block]:
+                return None
+
+        rows = _pad(results[-1], width)
+        batch = results[-1]
+        next_start = tail_start + SYNC_BATCH_ROWS
+        while len(batch) == SYNC_BATCH_ROWS:
+            batch = sheet.get(f"{next_start}:{next_start + SYNC_BATCH_ROWS - 1}")
+            rows += _pad(batch, width)
+            next_start += SYNC_BATCH_ROWS
+
+        # The partial block synced last time must be unchanged (this also
+        # catches rows deleted from the end of the sheet)
+        tail = state["tail"]
+        if rows[:len(tail)] != tail:
+            return None
+        new_rows = rows[len(tail):]
+        self._extend_state(new_rows)
+        return new_rows
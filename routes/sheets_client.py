@@ -0,0 +1,98 @@
+import os
+import logging
+import json
+import base64
+import threading
+from datetime import datetime, timedelta, timezone
+from .lazy import lazy_import
+from .metrics import count_response_bytes
+
+gspread = lazy_import("gspread")
+requests = lazy_import("requests")
+google_requests = lazy_import("google.auth.transport.requests")
+service_account = lazy_import("google.oauth2.service_account")
+
+logger = logging.getLogger(__name__)
+
+# Spreadsheet URL
+SHEET_URL = "https://docs.google.com/spreadsheets/d/1LUQhz49MVcnhnk3UuLleI_VYMgFNWV1YBVPbHlfdjpc/edit#gid=0"
+SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+# Refresh the OAuth token this long before it actually expires
+TOKEN_REFRESH_MARGIN = timedelta(seconds=int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300")))
+# Keep-alive connections kept open to the Google APIs
+HTTP_POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", "10"))
+
+_lock = threading.Lock()
+_credentials_info = None
+_credentials = None
+_client = None
+_worksheet = None
+_token_session = None
+
+
+def load_credentials_info():
+    # Decodes GOOGLE_CREDENTIALS (Base64 encoded service account JSON) once
+    global _credentials_info
+    if _credentials_info is None:
+        google_credentials_b64 = os.environ.get("GOOGLE_CREDENTIALS")
+        if not google_credentials_b64:
+            raise Exception("GOOGLE_CREDENTIALS environment variable not set")
+        _credentials_info = json.loads(base64.b64decode(google_credentials_b64).decode("utf-8"))
+    return _credentials_info
+
+
+def _pooled_adapter():
+    return requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+
+
+def _refresh_token_if_needed():
+    # google-auth only refreshes once the token has expired; refreshing ahead
+    # of time keeps the token exchange off the request path
+    global _token_session
+    expiry = _credentials.expiry
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC
+    if _credentials.token and expiry and expiry - now > TOKEN_REFRESH_MARGIN:
+        return
+    if _token_session is None:
+        _token_session = requests.Session()
+        _token_session.mount("https://", _pooled_adapter())
+    _credentials.refresh(google_requests.Request(session=_token_session))
+    logger.info(f"Refreshed Google OAuth token (expires {_credentials.expiry}).")
+
+
+def get_client():
+    # Authorized gspread client shared by the whole process
+    global _credentials, _client
+    with _lock:
+        if _client is None:
+            _credentials = service_account.Credentials.from_service_account_info(load_credentials_info(), scopes=SCOPES)
+            _client = gspread.authorize(_credentials)
+            # The underlying AuthorizedSession is a requests.Session; give it a
+            # larger keep-alive pool so concurrent refreshes reuse connections
+            _client.http_client.session.mount("https://", _pooled_adapter())
+            # Sheets API response sizes for /metrics
+            _client.http_client.session.hooks["response"].append(count_response_bytes)
+            logger.info("Authorized client.")
+        _refresh_token_if_needed()
+        return _client
+
+
+def get_worksheet():
+    # Opened first worksheet of SHEET_URL, cached so the spreadsheet metadata
+    # lookup only happens once per process
+    global _worksheet
+    client = get_client()
+    with _lock:
+        if _worksheet is None:
+            _worksheet = client.open_by_url(SHEET_URL).sheet1
+            logger.info("Opened sheet.")
+        return _worksheet
+
+
+def reset():
+    # Drop the cached handles after an API error so the next call starts clean
+    global _client, _worksheet
+    with _lock:
+        _client = None
+        _worksheet = None
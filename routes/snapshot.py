@@ -0,0 +1,105 @@
+import os
+import logging
+import json
+import time
+import tempfile
+from .lazy import lazy_import
+
+pa = lazy_import("pyarrow")
+
+logger = logging.getLogger(__name__)
+
+# Local columnar copy of the sheet, kept next to the reports folder so a
+# restarted or freshly spawned worker can serve requests before the first fetch
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_PATH = os.getenv("DATA_SNAPSHOT_PATH", os.path.join(BASE_DIR, "data", "damper_snapshot.arrow"))
+
+# Bump whenever the layout of the stored frame changes; older files are ignored
+SCHEMA_VERSION = "4"
+# Snapshots older than this (seconds) are considered too stale to serve at all
+SNAPSHOT_MAX_AGE = float(os.getenv("DATA_SNAPSHOT_MAX_AGE", str(7 * 24 * 3600)))
+
+_META_SCHEMA = b"damper.schema_version"
+_META_VERSION = b"damper.data_version"
+_META_SAVED_AT = b"damper.saved_at"
+_META_SYNC_STATE = b"damper.sync_state"
+
+
+def _arrow_table(df):
+    # Sheet columns can mix ints and strings; Arrow needs one type per column
+    out = df.copy()
+    for col in out.columns:
+        if out[col].dtype == object:
+            values = out[col]
+            out[col] = values.astype(str).where(values.notna(), None)
+    return pa.Table.from_pandas(out, preserve_index=False)
+
+
+def save_snapshot(df, data_version, saved_at=None, sync_state=None, path=SNAPSHOT_PATH):
+    table = _arrow_table(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata.update({
+        _META_SCHEMA: SCHEMA_VERSION.encode(),
+        _META_VERSION: str(data_version).encode(),
+        _META_SAVED_AT: repr(saved_at or time.time()).encode(),
+        # Lets the incremental sheet sync resume after a restart
+        _META_SYNC_STATE: json.dumps(sync_state).encode(),
+    })
+    table = table.replace_schema_metadata(metadata)
+
+    # Write to a temp file in the same folder, then atomically swap it in so
+    # readers never see a half-written snapshot
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as sink:
+            # Uncompressed IPC file format, so it can be memory mapped on load
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    # Returns (df, data_version, saved_at, sync_state) or None if there is no usable snapshot
+    if not os.path.exists(path):
+        return None
+    try:
+        # Memory mapped: the numeric columns stay backed by the page cache
+        # and shared between worker processes; to_pandas() below still copies
+        # the categorical (one byte per row) and datetime columns into each one
+        source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(source).read_all()
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+    metadata = table.schema.metadata or {}
+    schema_version = metadata.get(_META_SCHEMA, b"").decode()
+    if schema_version != SCHEMA_VERSION:
+        logger.warning(f"Ignoring snapshot with schema version {schema_version or 'unknown'} (expected {SCHEMA_VERSION}).")
+        return None
+
+    saved_at = float(metadata.get(_META_SAVED_AT, b"0").decode())
+    if time.time() - saved_at > SNAPSHOT_MAX_AGE:
+        logger.warning(f"Ignoring snapshot saved {time.time() - saved_at:.0f}s ago (older than {SNAPSHOT_MAX_AGE:.0f}s).")
+        return None
+
+    data_version = metadata.get(_META_VERSION, b"").decode()
+    sync_state = json.loads(metadata.get(_META_SYNC_STATE, b"null").decode())
+    df = table.to_pandas(split_blocks=True)
+    return df, data_version, saved_at, sync_state
+
+
+def snapshot_version(path=SNAPSHOT_PATH):
+    # Data version stamp of the snapshot on disk, read from the file footer only
+    try:
+        with pa.memory_map(path, "r") as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    return metadata.get(_META_VERSION, b"").decode() or None
@@ -0,0 +1,47 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Per-phase timing of the app start, up to the first response served.
+
+    `started` is a time.perf_counter() value taken as early as possible
+    (the top of app.py); each phase() call records the time since the
+    previous one.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self._last = self.started
+        self.phases = []
+        self.ready = None
+        self.first_response = None
+
+    def phase(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def finish(self):
+        # The app is imported and ready to serve
+        self.ready = time.perf_counter() - self.started
+        breakdown = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        logger.info(f"Startup took {self.ready * 1000:.0f}ms ({breakdown}).")
+
+    def response_sent(self, response):
+        # after_request hook; records when the first response went out
+        if self.first_response is None:
+            self.first_response = time.perf_counter() - self.started
+            logger.info(f"First response {self.first_response * 1000:.0f}ms after start.")
+        return response
+
+    def report(self):
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+        return {
+            "phases_ms": {name: ms(seconds) for name, seconds in self.phases},
+            "ready_ms": ms(self.ready),
+            "first_response_ms": ms(self.first_response),
+        }
@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# Per-stage timers (fetch, normalize, filter, aggregate, render, export),
+# reported in a Server-Timing header and one log record per request.
+# SERVER_TIMING=0 turns them off; stage() then costs a function call.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """Times a block as one stage: `with stage("aggregate"): ...`.
+
+    Inside a request the time is added to that request's Server-Timing
+    header (repeated stages add up); elsewhere (background refreshes,
+    report jobs) it is logged right away.
+    """
+    if not SERVER_TIMING:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def record_stage(name, seconds):
+    if has_request_context():
+        timings = g.setdefault("stage_timings", {})
+        timings[name] = timings.get(name, 0.0) + seconds
+    else:
+        logger.info(f"Stage {name} took {seconds * 1000:.1f}ms",
+                    extra={"stage": name, "duration_ms": round(seconds * 1000, 2)})
+
+
+def start_request_timer():
+    # before_request hook; registered first so the total covers the other hooks
+    if SERVER_TIMING:
+        g.request_started = time.perf_counter()
+
+
+def add_server_timing(response):
+    # after_request hook: "fetch;dur=12.3, aggregate;dur=4.5, total;dur=20.1"
+    started = g.get("request_started")
+    if started is None:
+        return response
+    total_ms = (time.perf_counter() - started) * 1000
+    timings = {name: round(seconds * 1000, 2) for name, seconds in g.get("stage_timings", {}).items()}
+    entries = [f"{name};dur={ms:.1f}" for name, ms in timings.items()]
+    entries.append(f"total;dur={total_ms:.1f}")
+    response.headers.add("Server-Timing", ", ".join(entries))
+
+    # Requests that did no staged work (static files, memo hits) are not logged
+    if timings:
+        breakdown = ", ".join(f"{name} {ms:.1f}ms" for name, ms in timings.items())
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} in {total_ms:.1f}ms ({breakdown})",
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(total_ms, 2),
+                "stages_ms": timings,
+                "data_version": g.get("data_version"),
+            },
+        )
+    return response
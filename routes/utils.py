@@ -1,66 +1,246 @@
 import os
 import json
-import pandas as pd
-import gspread
-import base64
-from google.oauth2.service_account import Credentials
+import hashlib
+import logging
+import time
+import threading
+from flask import g, has_request_context, request, session, url_for
+from . import sheets_client
+from . import snapshot
+from .sheet_sync import IncrementalSheetSync
+from .data_cache import DatasetCache, dataset_fingerprint
+from .normalize import ALIASES, normalize_dataset, append_rows
+from .cube import build_failure_cube, missing_columns
+from .memo import ResultMemo, memoize_view
+from .conditional import conditional_view
+from . import report_store
+from .report_jobs import ReportJobs
+from .export import TABLE_EXTENSION, table_writer
+from .dimensions import DimensionIndex
+from .local_source import local_data_file
+from .timing import stage
+from .metrics import SHEET_FETCHES, observe_fetch
+from .lazy import lazy_import
 
-# Spreadsheet URL
-SHEET_URL = "https://docs.google.com/spreadsheets/d/1LUQhz49MVcnhnk3UuLleI_VYMgFNWV1YBVPbHlfdjpc/edit#gid=0"
+pd = lazy_import("pandas")
 
-def get_google_sheets_data():
+logger = logging.getLogger(__name__)
+
+# Remembers how much of the sheet has been synced already
+sheet_sync = IncrementalSheetSync()
+
+def fetch_google_sheets_data(previous=None):
+    # Downloads the sheet (only the newly appended rows when `previous` is the
+    # result of the last sync); use get_google_sheets_data() for the cached copy.
+    # With DAMPER_DATA_FILE set, that local file stands in for the sheet.
+    if local_data_file is not None:
+        return fetch_local_data(previous)
     try:
-        print("Starting get_google_sheets_data()...")
-        
-        # Load credentials from environment variable - use the same name as the first file
-        google_credentials_b64 = os.environ.get("GOOGLE_CREDENTIALS")
-        
-        if not google_credentials_b64:
-            print("Environment variables available:", [k for k in os.environ.keys() if 'GOOGLE' in k.upper()])
-            raise Exception("GOOGLE_CREDENTIALS environment variable not set")
-        
-        # Decode from Base64 first (same as in first file)
-        try:
-            cred_dict = json.loads(base64.b64decode(google_credentials_b64).decode("utf-8"))
-            print("Successfully decoded credentials from Base64")
-        except Exception as e:
-            print(f"Error decoding credentials from Base64: {e}")
-            raise
-        
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = Credentials.from_service_account_info(cred_dict, scopes=scope)
-        client = gspread.authorize(creds)
-        print("Authorized client.")
-        
-        sheet = client.open_by_url(SHEET_URL).sheet1
-        print("Opened sheet.")
-        
-        data = sheet.get_all_records()
-        print(f"Retrieved {len(data)} rows from sheet.")
-        
-        df = pd.DataFrame(data)
-        return df, None
+        logger.info("Starting fetch_google_sheets_data()...")
+
+        started = time.perf_counter()
+        with stage("fetch"):
+            sheet = sheets_client.get_worksheet()
+            df, appended = sheet_sync.fetch(sheet, previous)
+        # Bytes are counted by the client's response hook
+        observe_fetch("sheet", started, len(df))
+        if not appended:
+            logger.info(f"Retrieved {len(df)} rows from sheet.")
+            with stage("normalize"):
+                return normalize_dataset(df), None
+
+        logger.info(f"Retrieved {len(df)} new rows from sheet.")
+        with stage("normalize"):
+            return append_rows(previous, normalize_dataset(df)), None
     except Exception as e:
-        print("ERROR in get_google_sheets_data:", e)
+        SHEET_FETCHES.labels("sheet", "error").inc()
+        logger.error(f"ERROR in fetch_google_sheets_data: {e}")
+        # Start over with a fresh client/worksheet handle on the next attempt
+        sheets_client.reset()
         return pd.DataFrame(), str(e)
 
-def categorize_age(days):
-    if days is None or days == "" or str(days).lower() == "nan":
-        return "3-5 years"
+def fetch_local_data(previous=None):
+    # Same contract as fetch_google_sheets_data, reading DAMPER_DATA_FILE
     try:
-        days = int(days)
-    except ValueError:
-        return "3-5 years"
-    
-    if days < 730:
-        return "Less than 2 years"
-    elif 730 <= days < 1095:
-        return "2-3 years"
-    elif 1095 <= days < 1825:
-        return "3-5 years"
-    else:
-        return "Above 5 years"
-
-# Create reports folder if it doesn't exist
-REPORT_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "reports")
-os.makedirs(REPORT_FOLDER, exist_ok=True)
\ No newline at end of file
+        started = time.perf_counter()
+        with stage("fetch"):
+            df, changed = local_data_file.fetch(previous)
+        if not changed:
+            return previous, None
+        observe_fetch("file", started, len(df), os.path.getsize(local_data_file.path))
+        logger.info(f"Read {len(df)} rows from {local_data_file.path}.")
+        with stage("normalize"):
+            return normalize_dataset(df), None
+    except Exception as e:
+        SHEET_FETCHES.labels("file", "error").inc()
+        logger.error(f"ERROR in fetch_local_data: {e}")
+        return pd.DataFrame(), str(e)
+
+# Part of every sheet version, so a changed alias mapping is a new version
+_ALIASES_DIGEST = hashlib.sha1(json.dumps(ALIASES, sort_keys=True).encode("utf-8")).hexdigest()
+
+def dataset_version(df):
+    # Sheet data is versioned from the sync state, which an incremental sync
+    # only extends, instead of hashing every row on each refresh. The same rows
+    # get the same version in every worker. DAMPER_DATA_FILE is re-read whole
+    # anyway, so it is fingerprinted whole.
+    synced = sheet_sync.version() if local_data_file is None else None
+    if synced is None:
+        return dataset_fingerprint(df)
+    return hashlib.sha1(f"{synced}:{_ALIASES_DIGEST}".encode("utf-8")).hexdigest()[:16]
+
+# Shared by every worker thread in the process
+dataset_cache = DatasetCache(fetch_google_sheets_data, versioner=dataset_version)
+
+# Persist every refreshed dataset locally (set DATA_SNAPSHOT_ENABLED=0 to disable)
+SNAPSHOT_ENABLED = os.getenv("DATA_SNAPSHOT_ENABLED", "1") == "1"
+# When a worker loads the snapshot: "startup" (while the app is imported),
+# "lazy" (on the first request that needs data) or "off"
+SNAPSHOT_HYDRATE = os.getenv("DATA_SNAPSHOT_HYDRATE", "lazy")
+
+def save_dataset_snapshot(df, version, loaded_at):
+    if snapshot.snapshot_version() == version:
+        return  # Nothing changed since the last snapshot
+    snapshot.save_snapshot(df, version, loaded_at, sync_state=sheet_sync.state)
+    logger.info(f"Saved dataset snapshot {version} to {snapshot.SNAPSHOT_PATH}.")
+
+def hydrate_from_snapshot():
+    # Serve the last snapshot right away; it is refreshed in the background
+    # as soon as it is older than the cache TTL
+    if not SNAPSHOT_ENABLED:
+        return False
+    loaded = snapshot.load_snapshot()
+    if loaded is None:
+        return False
+    df, version, saved_at, sync_state = loaded
+    if dataset_cache.seed(df, version, saved_at):
+        sheet_sync.restore(sync_state)
+        dimension_index.update(df, version)
+        logger.info(f"Loaded dataset snapshot {version} ({len(df)} rows).")
+        return True
+    return False
+
+_hydrate_lock = threading.Lock()
+_hydrate_pending = SNAPSHOT_HYDRATE == "lazy"
+
+def hydrate_on_first_use():
+    # "lazy" mode: the first request needing data loads the snapshot, so
+    # startup stays free of pandas / pyarrow
+    global _hydrate_pending
+    if not _hydrate_pending:
+        return
+    with _hydrate_lock:
+        if _hydrate_pending:
+            hydrate_from_snapshot()
+            _hydrate_pending = False
+
+if SNAPSHOT_ENABLED:
+    dataset_cache.add_refresh_listener(save_dataset_snapshot)
+
+def get_failure_cube():
+    # Failure/receipt counts per Make x Type x Age Group x day for the cached data
+    df, error = get_google_sheets_data()
+    if error:
+        return None, error
+    missing = missing_columns(df) if not df.empty else []
+    if missing:
+        return None, f"Missing required columns - {', '.join(missing)}"
+    version = g.get("data_version") if has_request_context() else None
+    return dataset_cache.derived("failure_cube", build_failure_cube, version), None
+
+def prime_failure_cube(df, version, loaded_at):
+    # Build the cube right after each refresh instead of on the first request
+    if df.empty or not missing_columns(df):
+        dataset_cache.derived("failure_cube", build_failure_cube)
+
+dataset_cache.add_refresh_listener(prime_failure_cube)
+
+# Distinct makes / types / age groups for the dropdowns, kept current on refresh
+dimension_index = DimensionIndex()
+dataset_cache.add_refresh_listener(dimension_index.update)
+
+def dimension_values(column):
+    # Options for a dropdown, from the dimension index. The data is only loaded
+    # here when nothing has been loaded yet (cold start without a snapshot).
+    if not dimension_index.ready:
+        df, error = get_google_sheets_data()
+        if error:
+            return None, error
+    version = dimension_index.resolve(requested_data_version())
+    pin_data_version(version)
+    return dimension_index.values(column, version), None
+
+# How long (seconds) the requests of one navigation flow keep reading the
+# dataset version the flow started with
+DATA_PIN_SECONDS = float(os.getenv("DATA_PIN_SECONDS", "120"))
+
+def requested_data_version():
+    # ?v=<version>, else the version pinned in the session while the pin is fresh
+    version = request.args.get("v")
+    if version:
+        return version
+    pin = session.get("data_pin")
+    if pin and time.time() - pin["at"] < DATA_PIN_SECONDS:
+        return pin["version"]
+    return None
+
+def pin_data_version(version):
+    # Follow-up requests in this session read `version` until the pin expires
+    g.data_version = version
+    pin = session.get("data_pin")
+    if not pin or pin["version"] != version or time.time() - pin["at"] >= DATA_PIN_SECONDS:
+        session["data_pin"] = {"version": version, "at": time.time()}
+
+def get_google_sheets_data():
+    # The normalized, shared frame: filter it, but never modify it in place.
+    # Within a request it is always the same (pinned) version.
+    hydrate_on_first_use()
+    if not has_request_context():
+        df, error, age = dataset_cache.get()
+        return df, error
+    if "dataset" in g:
+        return g.dataset
+    df, error, age, version = dataset_cache.get_version(requested_data_version())
+    g.data_age = age
+    if not error:
+        pin_data_version(version)
+    g.dataset = (df, error)
+    return df, error
+
+# Rendered analysis/chart responses, for the versions requests may be pinned to
+result_memo = ResultMemo(versions=dataset_cache.versions_kept)
+
+def current_data_version():
+    # Version of the data the routes would use right now (None if unavailable)
+    df, error = get_google_sheets_data()
+    if error or df.empty:
+        return None
+    return g.data_version if has_request_context() else dataset_cache.version
+
+def memoized(session_keys=()):
+    # Serve repeated identical requests from result_memo until the data changes
+    return memoize_view(result_memo, current_data_version, session_keys)
+
+def conditional():
+    # ETag / Last-Modified validators; 304 when the client's copy is current
+    return conditional_view(current_data_version, lambda: dataset_cache.changed_at or 0)
+
+# Memoized pages link to report files; forget them once any file is evicted
+report_store.add_eviction_listener(result_memo.clear)
+
+# Excel reports are written by these background workers, not in the request
+report_jobs = ReportJobs()
+report_jobs.add_failure_listener(lambda job: result_memo.clear())
+
+def queue_report(store, prefix, key, write, download_link, table=None):
+    # Submit (or join) the job writing a report; the returned status tells
+    # the page where to poll until download_link is available. `table` (the
+    # report's summary frame) is stored with it for CSV / Parquet downloads.
+    extra_files = {TABLE_EXTENSION: table_writer(table)} if table is not None else None
+    job = report_jobs.submit(store, prefix, key, write, download_link, extra_files)
+    # The link travels with the status URL, so any worker can answer it once the file exists
+    job["status_url"] = url_for("reports.report_status", job_id=job["id"], download=download_link)
+    return job
+
+# Reports folder (created by the report store when the first report is written)
+REPORT_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "reports")
\ No newline at end of file